@@ -0,0 +1,119 @@
+import io
+import random
+import textwrap
+from typing import Callable, List, NamedTuple, Tuple
+from faker import Faker
+
+# Approximate document sizes in characters
+SIZES = {"small": 2_000, "medium": 20_000, "large": 200_000}
+# Share of sentences that carry one PII value
+DENSITIES = {"sparse": 0.05, "dense": 0.4}
+
+
+class GoldSpan(NamedTuple):
+    """A PII value planted in a synthetic document, with its character offsets."""
+    entity_type: str
+    start: int
+    end: int
+    value: str
+
+
+class SyntheticDocument(NamedTuple):
+    name: str
+    text: str
+    spans: List[GoldSpan]
+
+
+# (Presidio entity type, sentence with one slot, value generator)
+_TEMPLATES: List[Tuple[str, str, Callable[[Faker], str]]] = [
+    ("PERSON", "Please forward the signed copy to {} before Friday.", lambda f: f.name()),
+    ("PERSON", "The account manager, {}, approved the change.", lambda f: f.name()),
+    ("EMAIL_ADDRESS", "Questions can be sent to {} at any time.", lambda f: f.email()),
+    ("PHONE_NUMBER", "Call the front desk on {} to reschedule.", lambda f: f.numerify("###-###-####")),
+    ("CREDIT_CARD", "The payment was charged to card {} yesterday.", lambda f: f.credit_card_number(card_type="visa16")),
+    ("US_SSN", "Her social security number is {} according to the form.", lambda f: f.ssn()),
+    ("LOCATION", "The team relocated to {} last spring.", lambda f: f.city()),
+    ("IP_ADDRESS", "The login came from {} shortly after midnight.", lambda f: f.ipv4_public()),
+    ("DATE_TIME", "The contract was renewed on {} without changes.", lambda f: f.date(pattern="%B %d, %Y")),
+]
+
+SENTENCES_PER_PARAGRAPH = 5
+
+
+def generate_document(name: str, target_chars: int, density: float, seed: int = 0) -> SyntheticDocument:
+    """
+    Build a document of roughly `target_chars` characters from filler sentences,
+    planting one PII value in about `density` of them. The same seed always
+    gives the same document.
+    """
+    fake = Faker("en_US")
+    fake.seed_instance(seed)
+    rng = random.Random(seed)
+
+    parts: List[str] = []
+    spans: List[GoldSpan] = []
+    pos = 0
+    sentence_count = 0
+    while pos < target_chars:
+        if sentence_count and sentence_count % SENTENCES_PER_PARAGRAPH == 0:
+            separator = "\n\n"
+        elif sentence_count:
+            separator = " "
+        else:
+            separator = ""
+        parts.append(separator)
+        pos += len(separator)
+
+        if rng.random() < density:
+            entity_type, template, make_value = rng.choice(_TEMPLATES)
+            value = make_value(fake)
+            before, after = template.split("{}")
+            spans.append(GoldSpan(entity_type, pos + len(before), pos + len(before) + len(value), value))
+            sentence = before + value + after
+        else:
+            # Filler from the lorem provider; any entity found in it counts as a false positive
+            sentence = fake.sentence(nb_words=12)
+        parts.append(sentence)
+        pos += len(sentence)
+        sentence_count += 1
+
+    return SyntheticDocument(name, "".join(parts), spans)
+
+
+def generate_corpus(sizes: List[str], densities: List[str], seed: int = 0) -> List[SyntheticDocument]:
+    documents = []
+    for size in sizes:
+        for density in densities:
+            documents.append(generate_document(f"{size}-{density}", SIZES[size], DENSITIES[density], seed))
+    return documents
+
+
+def to_pdf(document: SyntheticDocument) -> bytes:
+    """Lay the text out on Letter pages with PyMuPDF."""
+    import fitz
+    pdf = fitz.open()
+    margin, line_height, font_size = 72, 14, 10
+    page = None
+    y = 0
+    for paragraph in document.text.split("\n\n"):
+        for line in textwrap.wrap(paragraph, width=95, break_long_words=False) + [""]:
+            if page is None or y > page.rect.height - margin:
+                page = pdf.new_page(width=612, height=792)
+                y = margin
+            if line:
+                page.insert_text((margin, y), line, fontsize=font_size)
+            y += line_height
+    data = pdf.tobytes(garbage=2, deflate=True)
+    pdf.close()
+    return data
+
+
+def to_docx(document: SyntheticDocument) -> bytes:
+    """One Word paragraph per text paragraph, written with python-docx."""
+    from docx import Document
+    docx = Document()
+    for paragraph in document.text.split("\n\n"):
+        docx.add_paragraph(paragraph)
+    output = io.BytesIO()
+    docx.save(output)
+    return output.getvalue()
@@ -0,0 +1,280 @@
+"""
+Redaction benchmark: throughput, latency percentiles, peak memory and
+per-entity precision/recall on a synthetic corpus, compared against a stored
+baseline.
+
+    cd backend
+    python -m benchmarks.run_benchmarks                    # run and compare with baseline.json
+    python -m benchmarks.run_benchmarks --update-baseline  # record a new baseline
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional
+
+# Run from backend/ so `services` resolves the same way it does for main.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psutil
+from benchmarks.corpus import DENSITIES, SIZES, GoldSpan, SyntheticDocument, generate_corpus, to_docx, to_pdf
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+ENGINES = ["presidio", "rules", "pdf", "docx"]
+
+# Rules used for the rules_engine benchmark, in place of a user's stored rules
+BENCHMARK_RULES = {
+    "blocklist": ["Project Falcon", "internal only"],
+    "pii_categories": {"names": True, "emails": True, "phone": True, "dates": True, "credit_cards": True},
+}
+
+
+class PeakRss:
+    """Samples this process's resident memory in the background; reports growth at the peak."""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self._process = psutil.Process(os.getpid())
+        self._stop = threading.Event()
+        self.start_rss = 0
+        self.peak_rss = 0
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak_rss = max(self.peak_rss, self._process.memory_info().rss)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.start_rss = self.peak_rss = self._process.memory_info().rss
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_rss = max(self.peak_rss, self._process.memory_info().rss)
+
+    @property
+    def peak_mb(self) -> float:
+        return round((self.peak_rss - self.start_rss) / (1024 * 1024), 1)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def span_scores(gold: List[GoldSpan], predicted: List[list]) -> Dict[str, Dict]:
+    """
+    Per-entity precision and recall. A prediction is correct when it overlaps
+    a gold span of the same type; predicted types that were never planted
+    only count against precision.
+    """
+    stats: Dict[str, Dict[str, int]] = defaultdict(lambda: {"tp": 0, "fn": 0, "fp": 0, "found": 0})
+    for span in gold:
+        hit = any(p[0] == span.entity_type and p[1] < span.end and p[2] > span.start for p in predicted)
+        stats[span.entity_type]["tp" if hit else "fn"] += 1
+    for entity_type, start, end, _score in predicted:
+        hit = any(g.entity_type == entity_type and start < g.end and end > g.start for g in gold)
+        stats[entity_type]["found" if hit else "fp"] += 1
+    return _finish_scores(stats)
+
+
+def leak_scores(gold: List[GoldSpan], redacted_text: str) -> Dict[str, Dict]:
+    """
+    Per-entity recall for outputs without spans (rendered files, rules engine):
+    a planted value counts as found when it no longer appears in the output.
+    Whitespace is normalized so line wrapping in PDFs doesn't hide leaks.
+    """
+    haystack = " ".join(redacted_text.split())
+    stats: Dict[str, Dict[str, int]] = defaultdict(lambda: {"tp": 0, "fn": 0})
+    for span in gold:
+        leaked = " ".join(span.value.split()) in haystack
+        stats[span.entity_type]["fn" if leaked else "tp"] += 1
+    return _finish_scores(stats)
+
+
+def _finish_scores(stats: Dict[str, Dict[str, int]]) -> Dict[str, Dict]:
+    scores = {}
+    for entity_type, s in sorted(stats.items()):
+        support = s["tp"] + s["fn"]
+        entry = {"support": support, "recall": round(s["tp"] / support, 4) if support else None}
+        if "fp" in s:
+            predicted = s["found"] + s["fp"]
+            entry["precision"] = round(s["found"] / predicted, 4) if predicted else None
+        scores[entity_type] = entry
+    return scores
+
+
+def micro_recall(scores: Dict[str, Dict]) -> Optional[float]:
+    support = sum(s["support"] for s in scores.values())
+    found = sum(s["recall"] * s["support"] for s in scores.values() if s["support"])
+    return round(found / support, 4) if support else None
+
+
+def run_case(name: str, document: SyntheticDocument, run: Callable[[], Dict], repeat: int) -> Dict:
+    """Time `run` over `repeat` calls after one warm-up call; score the warm-up output."""
+    scores = run()
+    latencies = []
+    with PeakRss() as rss:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            run()
+            latencies.append(time.perf_counter() - started)
+
+    total = sum(latencies)
+    result = {
+        "case": name,
+        "chars": len(document.text),
+        "pii_values": len(document.spans),
+        "runs": repeat,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 1),
+            "p95": round(percentile(latencies, 95) * 1000, 1),
+            "p99": round(percentile(latencies, 99) * 1000, 1),
+        },
+        "chars_per_second": round(len(document.text) * repeat / total) if total else None,
+        "peak_rss_mb": rss.peak_mb,
+        "recall": micro_recall(scores),
+        "entities": scores,
+    }
+    print(f"{name:40s} p50 {result['latency_ms']['p50']:>9.1f} ms  "
+          f"{result['chars_per_second'] or 0:>10d} chars/s  recall {result['recall']}", flush=True)
+    return result
+
+
+def build_cases(engines: List[str], tier: str, documents: List[SyntheticDocument]) -> List[tuple]:
+    """(case name, document, callable returning per-entity scores) for each engine and document."""
+    from services.redaction import RedactionService
+    from services.result_cache import ResultCache
+
+    service = RedactionService()
+    # Every run must do the work; a cache hit would measure the cache
+    service.result_cache = ResultCache(max_entries=0)
+
+    cases = []
+    for document in documents:
+        if "presidio" in engines:
+            def presidio(document=document):
+                _redacted, spans = service.redact_with_presidio_spans(document.text, tier=tier)
+                return span_scores(document.spans, spans)
+            cases.append((f"presidio/{tier}/text/{document.name}", document, presidio))
+
+        if "rules" in engines:
+            from services import rules_engine
+            # Fixed rules instead of the user's stored ones, so runs don't depend on Supabase
+            benchmark_rules = {**BENCHMARK_RULES, "version": rules_engine.rules_version(BENCHMARK_RULES)}
+
+            def rules(document=document):
+                redacted = rules_engine.redact_text_selectively(document.text, "benchmark", rules=benchmark_rules)
+                return leak_scores(document.spans, redacted)
+            cases.append((f"rules/text/{document.name}", document, rules))
+
+        if "pdf" in engines:
+            import fitz
+            pdf_bytes = to_pdf(document)
+
+            def pdf(document=document, pdf_bytes=pdf_bytes):
+                redacted = service.redact_pdf_file(pdf_bytes, tier=tier)
+                with fitz.open(stream=redacted, filetype="pdf") as doc:
+                    text = "\n".join(page.get_text() for page in doc)
+                return leak_scores(document.spans, text)
+            cases.append((f"presidio/{tier}/pdf/{document.name}", document, pdf))
+
+        if "docx" in engines:
+            docx_bytes = to_docx(document)
+
+            def docx(document=document, docx_bytes=docx_bytes):
+                redacted = service.redact_docx_file(docx_bytes, tier=tier)
+                return leak_scores(document.spans, service.extract_text_from_docx(redacted))
+            cases.append((f"presidio/{tier}/docx/{document.name}", document, docx))
+    return cases
+
+
+def compare(results: List[Dict], baseline: Dict, tolerance: float, recall_tolerance: float) -> List[str]:
+    """Regressions against the baseline: slower, higher p95, or lower recall beyond the tolerances."""
+    previous = {case["case"]: case for case in baseline.get("cases", [])}
+    flags = []
+    for case in results:
+        old = previous.get(case["case"])
+        if old is None:
+            continue
+        name = case["case"]
+        if old.get("chars_per_second") and case["chars_per_second"] < old["chars_per_second"] * (1 - tolerance):
+            flags.append(f"{name}: throughput {case['chars_per_second']} chars/s, baseline {old['chars_per_second']}")
+        if old["latency_ms"]["p95"] and case["latency_ms"]["p95"] > old["latency_ms"]["p95"] * (1 + tolerance):
+            flags.append(f"{name}: p95 {case['latency_ms']['p95']} ms, baseline {old['latency_ms']['p95']} ms")
+        for entity_type, old_scores in old.get("entities", {}).items():
+            new_scores = case["entities"].get(entity_type)
+            for metric in ("recall", "precision"):
+                if old_scores.get(metric) is None or new_scores is None or new_scores.get(metric) is None:
+                    continue
+                if new_scores[metric] < old_scores[metric] - recall_tolerance:
+                    flags.append(f"{name}: {entity_type} {metric} {new_scores[metric]}, baseline {old_scores[metric]}")
+    return flags
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark text, PDF and DOCX redaction on a synthetic corpus.")
+    parser.add_argument("--engines", default=",".join(ENGINES), help=f"comma-separated subset of {ENGINES}")
+    parser.add_argument("--sizes", default="small,medium", help=f"comma-separated subset of {list(SIZES)}")
+    parser.add_argument("--densities", default=",".join(DENSITIES), help=f"comma-separated subset of {list(DENSITIES)}")
+    parser.add_argument("--tier", default="accurate", help="redaction tier for the Presidio cases")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per case, after one warm-up run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true", help="write this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative drop in speed")
+    parser.add_argument("--recall-tolerance", type=float, default=0.01, help="allowed absolute drop in recall/precision")
+    parser.add_argument("--output", help="also write the full report to this JSON file")
+    args = parser.parse_args(argv)
+
+    engines = [e.strip() for e in args.engines.split(",") if e.strip()]
+    documents = generate_corpus(args.sizes.split(","), args.densities.split(","), args.seed)
+    cases = build_cases(engines, args.tier, documents)
+
+    results = [run_case(name, document, run, args.repeat) for name, document, run in cases]
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "seed": args.seed,
+        "cases": results,
+    }
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --update-baseline to record one.")
+        return 0
+
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("seed") != args.seed:
+        print(f"Warning: baseline was recorded with seed {baseline.get('seed')}, this run used {args.seed}.")
+
+    flags = compare(results, baseline, args.tolerance, args.recall_tolerance)
+    if flags:
+        print(f"\n{len(flags)} regression(s) against the baseline:")
+        for flag in flags:
+            print(f"  - {flag}")
+        return 1
+    print("\nNo regressions against the baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
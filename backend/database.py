@@ -1,6 +1,7 @@
 import os
 from supabase import create_client, Client
-from typing import List, Dict, Optional
+from postgrest.types import ReturnMethod
+from typing import Iterator, List, Dict, Optional
 from datetime import datetime
 
 # Initialize Supabase Client
@@ -9,6 +10,9 @@ key: str = None
 
 supabase: Client = None
 
+# Rows per request when reading a whole table; PostgREST caps a response at 1000 by default
+PAGE_SIZE = int(os.getenv("SUPABASE_PAGE_SIZE", "1000"))
+
 def init_db():
     """Initialize Supabase client."""
     global supabase, url, key
@@ -31,7 +35,11 @@ def init_db():
         print(f"Warning: SUPABASE_URL or SUPABASE_KEY not found. URL present: {bool(url)}, Key present: {bool(key)}", flush=True)
 
 def migrate_db():
-    """No-op for Supabase as schema is managed via SQL editor."""
+    """
+    No-op for Supabase as schema is managed via SQL editor: run
+    supabase_setup.sql, which also adds documents.entity_spans and the
+    entity_index table.
+    """
     pass
 
 def _ensure_initialized():
@@ -42,7 +50,7 @@ def _ensure_initialized():
         init_db()
     return supabase is not None
 
-def save_document(filename: str, original_content: Optional[str], redacted_content: Optional[str], method: str, file_type: str = "text", file_path: Optional[str] = None, user_id: Optional[str] = None) -> int:
+def save_document(filename: str, original_content: Optional[str], redacted_content: Optional[str], method: str, file_type: str = "text", file_path: Optional[str] = None, user_id: Optional[str] = None, entity_spans: Optional[List[list]] = None) -> int:
     """Save a redacted document to Supabase."""
     """Save a redacted document to Supabase."""
     if not _ensure_initialized():
@@ -58,6 +66,10 @@ def save_document(filename: str, original_content: Optional[str], redacted_conte
         "file_path": file_path,
         "user_id": user_id
     }
+    # Analyzer output as [type, start, end, score] lists, so the document can be
+    # re-redacted under a new policy without running NER again
+    if entity_spans is not None:
+        data["entity_spans"] = entity_spans
     
     try:
         print(f"DEBUG: Attempting to save document: {filename}, user_id: {user_id}")
@@ -125,6 +137,138 @@ def get_document(doc_id: int) -> Optional[Dict]:
         print(f"Error fetching document {doc_id} from Supabase: {e}")
         return None
 
+def iter_documents_with_spans(user_id: str) -> Iterator[List[Dict]]:
+    """
+    Documents of a user that have stored entity spans, with the fields
+    re-redaction needs, one page of up to PAGE_SIZE rows at a time so only one
+    page of content is held at once. Raises if Supabase is unavailable or a
+    page can't be fetched.
+    """
+    if not _ensure_initialized():
+        raise RuntimeError("Supabase client is not initialized")
+
+    last_id = None
+    try:
+        while True:
+            query = (
+                supabase.table("documents")
+                .select("id, filename, method, file_type, user_id, original_content, entity_spans")
+                .eq("user_id", user_id)
+                .not_.is_("entity_spans", "null")
+            )
+            # Each page starts after the last id seen, so deep pages cost no more than the first
+            if last_id is not None:
+                query = query.gt("id", last_id)
+            response = query.order("id").limit(PAGE_SIZE).execute()
+            # Stop on an empty page, not a short one: the server's cap may be below PAGE_SIZE
+            if not response.data:
+                return
+            last_id = response.data[-1]["id"]
+            yield response.data
+    except Exception as e:
+        print(f"Error fetching documents with spans from Supabase: {e}")
+        raise
+
+def update_redacted_content(doc_id: int, redacted_content: str) -> bool:
+    """Replace the redacted text of a stored document."""
+    if not _ensure_initialized():
+        return False
+
+    try:
+        supabase.table("documents").update({"redacted_content": redacted_content}).eq("id", doc_id).execute()
+        return True
+    except Exception as e:
+        print(f"Error updating document {doc_id} in Supabase: {e}")
+        return False
+
+# Sent with each row of a batched update. An upsert checks the row it would
+# insert before finding the conflict, so the not-null columns need their
+# (unchanged) values even though only redacted_content is updated.
+_UPSERT_KEY_COLUMNS = ("id", "filename", "method", "file_type", "user_id")
+
+def update_redacted_contents(docs: List[Dict]) -> bool:
+    """
+    Replace the redacted text of many stored documents in one request. Each doc
+    is a row from iter_documents_with_spans with a new "redacted_content".
+    """
+    if not docs:
+        return True
+    if not _ensure_initialized():
+        return False
+
+    rows = [
+        {**{column: doc[column] for column in _UPSERT_KEY_COLUMNS}, "redacted_content": doc["redacted_content"]}
+        for doc in docs
+    ]
+    try:
+        supabase.table("documents").upsert(rows, on_conflict="id", returning=ReturnMethod.minimal).execute()
+        return True
+    except Exception as e:
+        print(f"Error updating {len(rows)} documents in Supabase: {e}")
+        return False
+
+def index_document_entities(rows: List[Dict]) -> bool:
+    """Add a document's entity index rows (see services.entity_index)."""
+    if not rows or not _ensure_initialized():
+        return False
+
+    try:
+        supabase.table("entity_index").insert(rows).execute()
+        return True
+    except Exception as e:
+        print(f"Error indexing document entities: {e}")
+        return False
+
+def search_entity_index(user_id: str, entity_type: str, value_hash: Optional[str] = None, limit: int = 1000) -> List[int]:
+    """IDs of up to `limit` of a user's documents containing an entity type, optionally with a specific value, newest first."""
+    if limit <= 0 or not _ensure_initialized():
+        return []
+
+    # A document has one row per distinct value, so rows are read in pages
+    # until `limit` distinct documents are found
+    doc_ids: List[int] = []
+    try:
+        while len(doc_ids) < limit:
+            query = (
+                supabase.table("entity_index")
+                .select("document_id")
+                .eq("user_id", user_id)
+                .eq("entity_type", entity_type)
+            )
+            if value_hash:
+                query = query.eq("value_hash", value_hash)
+            # Resume below the last document found; its remaining rows add nothing
+            if doc_ids:
+                query = query.lt("document_id", doc_ids[-1])
+            response = query.order("document_id", desc=True).limit(min(limit, PAGE_SIZE)).execute()
+            if not response.data:
+                break
+            for row in response.data:
+                if not doc_ids or row["document_id"] != doc_ids[-1]:
+                    doc_ids.append(row["document_id"])
+        return doc_ids[:limit]
+    except Exception as e:
+        print(f"Error searching entity index: {e}")
+        return []
+
+def get_document_summaries(doc_ids: List[int]) -> List[Dict]:
+    """Listing fields for the given documents, without their content."""
+    if not doc_ids or not _ensure_initialized():
+        return []
+
+    try:
+        response = (
+            supabase.table("documents")
+            .select("id, filename, method, file_type, created_at")
+            .in_("id", doc_ids)
+            .order("id", desc=True)
+            .execute()
+        )
+        return response.data
+    except Exception as e:
+        print(f"Error fetching document summaries from Supabase: {e}")
+        return []
+
 def save_reversible_doc(filename: str, original_path: str, redacted_path: str, password_hash: str, user_id: str) -> Optional[str]:
     """Save a reversible document record."""
     if not _ensure_initialized():
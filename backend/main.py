@@ -1,18 +1,24 @@
 import os
+import json
 # Fix for OpenMP conflict (OMP: Error #15: Initializing libiomp5md.dll, but found libiomp5md.dll already initialized)
 os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
 
 from dotenv import load_dotenv
 load_dotenv()
 
-from fastapi import FastAPI, UploadFile, File, Form
+from fastapi import FastAPI, UploadFile, File, Form, Request, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from services.redaction import RedactionService
 from services.audio_redaction import AudioRedactionService
 from services.video_redaction import VideoRedactionService
 from services.reversible_redaction import ReversibleRedactionService
 from services.llm_cleaner import process_dataset
+from services import model_registry, worker_pools, entity_index, redaction_tiers, entity_spans, rules_engine
+from services.worker_pools import PoolSaturatedError
 import imageio_ffmpeg
 import uuid
 import shutil
@@ -61,16 +67,51 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress large JSON responses (redacted documents); brotli when the client accepts it
+COMPRESSION_MIN_SIZE = int(os.getenv("RESPONSE_COMPRESSION_MIN_SIZE", "1024"))
+try:
+    from brotli_asgi import BrotliMiddleware
+    # Falls back to gzip for clients that don't send "br"
+    app.add_middleware(BrotliMiddleware, minimum_size=COMPRESSION_MIN_SIZE, gzip_fallback=True)
+except ImportError:
+    print("WARNING: brotli-asgi not found. Responses will be gzip-compressed only.", flush=True)
+    app.add_middleware(GZipMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
+
 # Initialize Services
 redaction_service = RedactionService()
 audio_service = AudioRedactionService()
-video_service = VideoRedactionService()
-reversible_service = ReversibleRedactionService()
+video_service = VideoRedactionService(audio_service)
+reversible_service = ReversibleRedactionService(redaction_service)
+
+@app.exception_handler(PoolSaturatedError)
+async def pool_saturated_handler(request: Request, exc: PoolSaturatedError):
+    # Shed load quickly instead of queueing work the server can't get to
+    return JSONResponse(
+        status_code=503,
+        headers={"Retry-After": str(exc.retry_after)},
+        content={"status": "error", "error": str(exc), "message": str(exc)}
+    )
 
 @app.get("/")
 def read_root():
     return {"status": "ok", "message": "Redactify API is running"}
 
+@app.get("/pools")
+def get_pools():
+    return {pool.name: pool.status() for pool in worker_pools.ALL_POOLS}
+
+@app.get("/models")
+def get_models():
+    return model_registry.memory_report()
+
+@app.get("/entities")
+def get_entities():
+    return {"entities": redaction_service.supported_entities()}
+
+@app.get("/tiers")
+def get_tiers():
+    return {"default": redaction_tiers.DEFAULT_TIER, "tiers": redaction_tiers.tier_report()}
+
 @app.get("/documents")
 def get_documents(user_id: str = None):
     print(f"DEBUG: Fetching documents for user_id: {user_id}", flush=True)
@@ -79,25 +120,159 @@ def get_documents(user_id: str = None):
     return {"documents": docs}
 
 @app.post("/upload")
-async def upload_file(file: UploadFile = File(...), user_id: str = Form(...)):
-    result = await redaction_service.process_file(file)
+async def upload_file(background_tasks: BackgroundTasks, file: UploadFile = File(...), user_id: str = Form(...), entities: str = Form(None), tier: str = Form(None), response_format: str = Form("full")):
+    # Optional comma-separated entity types, e.g. "EMAIL_ADDRESS,PHONE_NUMBER"
+    # Optional tier: "fast", "balanced" or "accurate" (see GET /tiers)
+    # response_format="spans" returns the original text once plus redaction ranges
+    if response_format not in ("full", "spans"):
+        return {"status": "error", "message": "response_format must be 'full' or 'spans'"}
+    try:
+        tier = redaction_tiers.get_tier(tier).name
+        entities = redaction_service.parse_entities(entities)
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+    result = await redaction_service.process_file(file, entities, tier)
     
     if result["status"] == "success":
         # Save to database
-        database.save_document(
+        doc_id = database.save_document(
             filename=result["original_filename"],
             original_content=result["original_content"],
             redacted_content=result["redacted_content"],
             method=result.get("method", "Unknown"),
             file_type="text",
-            user_id=user_id
+            user_id=user_id,
+            entity_spans=result.get("entity_spans")
         )
+
+        # Index entities after the response is sent
+        if doc_id and doc_id > 0 and result.get("entity_spans"):
+            rows = entity_index.build_index_rows(doc_id, user_id, result["original_content"], result["entity_spans"])
+            background_tasks.add_task(database.index_document_entities, rows)
         
-    return result
+    # Spans are stored for re-redaction, not sent back
+    response = {k: v for k, v in result.items() if k != "entity_spans"}
+    # The LLM path has no spans, so it always answers in full
+    if response_format == "spans" and result["status"] == "success" and result.get("entity_spans") is not None:
+        del response["redacted_content"]
+        response["response_format"] = "spans"
+        response["replacement"] = entity_spans.BLOCK
+        # Replacing each [start, end, type] range of original_content with the replacement gives the redacted text
+        response["redactions"] = entity_spans.redaction_ranges(result["original_content"], result["entity_spans"])
+    return response
+
+@app.post("/upload/stream")
+async def upload_file_stream(file: UploadFile = File(...), user_id: str = Form(...), entities: str = Form(None), tier: str = Form(None), stream_format: str = Form("ndjson")):
+    # Same as /upload with Presidio, but each page is sent as soon as it is redacted.
+    # stream_format: "ndjson" (one JSON object per line) or "sse" (text/event-stream)
+    if stream_format not in ("ndjson", "sse"):
+        return {"status": "error", "message": "stream_format must be 'ndjson' or 'sse'"}
+    try:
+        tier = redaction_tiers.get_tier(tier).name
+        entities = redaction_service.parse_entities(entities)
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+
+    content = await file.read()
+    records = redaction_service.stream_file(content, file.filename, entities, tier)
+    # The first record is taken here so a saturated pool still gets a 503, not a broken stream
+    first = await records.__anext__()
+
+    def encode(record: dict) -> str:
+        if stream_format == "sse":
+            return f"event: {record['type']}\ndata: {json.dumps(record)}\n\n"
+        return json.dumps(record) + "\n"
+
+    async def body():
+        yield encode(first)
+        async for record in records:
+            if record["type"] != "done":
+                yield encode(record)
+                continue
+
+            # Supabase calls block, so they run off the event loop
+            doc_id = await run_in_threadpool(
+                database.save_document,
+                filename=file.filename,
+                original_content=record["original_content"],
+                redacted_content=record["redacted_content"],
+                method=first["method"],
+                file_type="text",
+                user_id=user_id,
+                entity_spans=record["entity_spans"]
+            )
+            # Pages were already sent; the final record only carries the outcome
+            yield encode({"type": "done", "doc_id": doc_id, "pages": record["pages"], "method": first["method"], "status": "success"})
+
+            if doc_id and doc_id > 0 and record["entity_spans"]:
+                rows = entity_index.build_index_rows(doc_id, user_id, record["original_content"], record["entity_spans"])
+                await run_in_threadpool(database.index_document_entities, rows)
+
+    media_type = "text/event-stream" if stream_format == "sse" else "application/x-ndjson"
+    # identity keeps the compression middleware from buffering records
+    headers = {"Cache-Control": "no-cache", "Content-Encoding": "identity", "X-Accel-Buffering": "no"}
+    return StreamingResponse(body(), media_type=media_type, headers=headers)
+
+@app.get("/documents/search")
+def search_documents(user_id: str, entity_type: str, value: str = None, limit: int = 1000):
+    # e.g. ?entity_type=CREDIT_CARD, or ?entity_type=PERSON&value=Jane Doe
+    entity_type = entity_type.strip().upper()
+    value_hash = entity_index.value_hash(entity_type, value) if value else None
+    doc_ids = database.search_entity_index(user_id, entity_type, value_hash, limit)
+    return {"documents": database.get_document_summaries(doc_ids)}
+
+@app.post("/documents/reredact")
+def reredact_documents(user_id: str = Form(...), entities: str = Form(None), score_threshold: float = Form(0.0), style: str = Form("block")):
+    # Re-apply a policy to every stored document of a user from its saved spans (no NLP)
+    try:
+        entities = redaction_service.parse_entities(entities)
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+    documents = 0
+    updated = 0
+    try:
+        # One page of documents in memory at a time, written back with one request per page
+        for page in database.iter_documents_with_spans(user_id):
+            for doc in page:
+                doc["redacted_content"] = redaction_service.apply_spans(
+                    doc["original_content"], doc["entity_spans"], entities, score_threshold, style
+                )
+            documents += len(page)
+            if database.update_redacted_contents(page):
+                updated += len(page)
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+    except Exception:
+        return {"status": "error", "message": "Could not load the stored documents", "documents": documents, "updated": updated}
+    return {"status": "success", "documents": documents, "updated": updated}
+
+@app.post("/documents/{doc_id}/reredact")
+def reredact_document(doc_id: int, entities: str = Form(None), score_threshold: float = Form(0.0), style: str = Form("block")):
+    doc = database.get_document(doc_id)
+    if not doc:
+        return {"status": "error", "message": "Document not found"}
+    if doc.get("entity_spans") is None or doc.get("original_content") is None:
+        return {"status": "error", "message": "Document has no stored entity spans"}
+
+    try:
+        redacted = redaction_service.apply_spans(
+            doc["original_content"], doc["entity_spans"], redaction_service.parse_entities(entities), score_threshold, style
+        )
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+
+    database.update_redacted_content(doc_id, redacted)
+    return {"status": "success", "doc_id": doc_id, "redacted_content": redacted}
 
 @app.post("/reversible/upload")
-async def reversible_upload(file: UploadFile = File(...), password: str = Form(...), user_id: str = Form(...)):
-    return await reversible_service.process_upload(file, password, user_id)
+async def reversible_upload(file: UploadFile = File(...), password: str = Form(...), user_id: str = Form(...), entities: str = Form(None), output_format: str = Form("pdf"), tier: str = Form(None)):
+    # output_format="docx" keeps DOCX uploads as DOCX, redacted in place
+    try:
+        tier = redaction_tiers.get_tier(tier).name
+        entities = redaction_service.parse_entities(entities)
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+    return await reversible_service.process_upload(file, password, user_id, entities, output_format, tier)
 
 @app.post("/reversible/unlock")
 async def reversible_unlock(doc_id: str = Form(...), password: str = Form(...)):
@@ -154,8 +329,18 @@ async def redact_video(file: UploadFile = File(...), user_id: str = Form(...)):
     
     return result
 
+@app.post("/rules/invalidate")
+def invalidate_rules(user_id: str = Form(...)):
+    # Called after a user saves their rules so the next job doesn't use cached ones
+    rules_engine.invalidate_user_rules(user_id)
+    return {"status": "success"}
+
+@app.get("/rules/version")
+def get_rules_version(user_id: str):
+    return {"user_id": user_id, "version": rules_engine.get_user_rules(user_id)["version"]}
+
 @app.post("/clean-dataset")
-async def clean_dataset(file: UploadFile = File(...), text_column: str = "message", user_id: str = Form(...)):
+async def clean_dataset(file: UploadFile = File(...), text_column: str = "message", user_id: str = Form(...), keep_columns: str = Form(None)):
     # Save uploaded file
     file_ext = os.path.splitext(file.filename)[1]
     unique_filename = f"{uuid.uuid4()}{file_ext}"
@@ -164,12 +349,15 @@ async def clean_dataset(file: UploadFile = File(...), text_column: str = "messag
     output_filename = f"cleaned_{unique_filename}"
     output_path = os.path.join("outputs", output_filename)
     
-    with open(input_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-        
     try:
-        # Process dataset
-        process_dataset(input_path, output_path, text_column, user_id)
+        with worker_pools.dataset.slot():
+            with open(input_path, "wb") as buffer:
+                shutil.copyfileobj(file.file, buffer)
+
+            # Process dataset
+            # Comma-separated columns to carry over; everything else is never read
+            columns = [col.strip() for col in keep_columns.split(",") if col.strip()] if keep_columns else None
+            await worker_pools.dataset.submit(process_dataset, input_path, output_path, text_column, user_id, keep_columns=columns)
         
         # Return URL
         base_url = os.getenv("API_BASE_URL", "http://localhost:8000")
@@ -181,5 +369,7 @@ async def clean_dataset(file: UploadFile = File(...), text_column: str = "messag
             "cleaned_filename": output_filename,
             "url": url
         }
+    except PoolSaturatedError:
+        raise
     except Exception as e:
         return {"status": "error", "message": str(e)}
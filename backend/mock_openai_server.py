@@ -0,0 +1,56 @@
+import os
+import re
+import time
+import random
+import asyncio
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+import uvicorn
+
+# Minimal OpenAI-compatible chat completions server for exercising the GPT-4 path
+# locally. Run it, then start the API with:
+#   OPENAI_API_KEY=test OPENAI_BASE_URL=http://127.0.0.1:8002/v1
+#
+# MOCK_LATENCY adds a delay per completion (seconds) and MOCK_FAILURE_RATE makes a
+# fraction of requests fail, to check per-chunk Presidio fallback.
+
+LATENCY = float(os.getenv("MOCK_LATENCY", "0.5"))
+FAILURE_RATE = float(os.getenv("MOCK_FAILURE_RATE", "0"))
+
+PATTERNS = [
+    re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b'),
+    re.compile(r'\b\d{3}[-.]?\d{3}[-.]?\d{4}\b'),
+    re.compile(r'\b\d{4}[-\s]?\d{4}[-\s]?\d{4}[-\s]?\d{4}\b'),
+]
+
+app = FastAPI()
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    await asyncio.sleep(LATENCY)
+
+    if random.random() < FAILURE_RATE:
+        return JSONResponse(status_code=500, content={"error": {"message": "Mock failure", "type": "server_error"}})
+
+    text = body["messages"][-1]["content"]
+    for pattern in PATTERNS:
+        text = pattern.sub("████████", text)
+
+    return {
+        "id": f"chatcmpl-mock-{int(time.time() * 1000)}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "gpt-4"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": text},
+            "finish_reason": "stop"
+        }],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+    }
+
+
+if __name__ == "__main__":
+    uvicorn.run(app, host="127.0.0.1", port=8002)
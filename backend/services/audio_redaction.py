@@ -1,20 +1,15 @@
 import os
-import whisper
 import ffmpeg
 import imageio_ffmpeg
-from presidio_analyzer import AnalyzerEngine
 from typing import List
+from services import model_registry, worker_pools
 
 class AudioRedactionService:
     def __init__(self):
-        self.model = None
-        self.analyzer = AnalyzerEngine()
+        self.analyzer = model_registry.get_analyzer()
         self.ffmpeg_path = imageio_ffmpeg.get_ffmpeg_exe()
 
     async def process_audio(self, file, upload_dir="uploads", output_dir="outputs"):
-        if self.model is None:
-            self.model = whisper.load_model("base")
-
         os.makedirs(upload_dir, exist_ok=True)
         os.makedirs(output_dir, exist_ok=True)
 
@@ -23,11 +18,25 @@ class AudioRedactionService:
         output_filename = f"redacted_{filename}"
         output_path = os.path.join(output_dir, output_filename)
 
-        # Save uploaded file
-        with open(input_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
+        # Reserve a worker before writing the upload so busy servers reject fast
+        with worker_pools.audio.slot():
+            # Save uploaded file
+            with open(input_path, "wb") as f:
+                content = await file.read()
+                f.write(content)
+
+            # Whisper, Presidio and ffmpeg all block; run them on the audio pool
+            await worker_pools.audio.submit(self._redact_audio_file, input_path, output_path)
+
+        return {
+            "status": "success",
+            "original_filename": filename,
+            "redacted_filename": output_filename,
+            "redacted_file_path": output_path,
+            "method": "Audio Redaction (Whisper + Presidio + Bleep)"
+        }
 
+    def _redact_audio_file(self, input_path, output_path):
         # Transcribe and find sensitive intervals
         mute_intervals = self._analyze_audio_file(input_path)
 
@@ -39,20 +48,11 @@ class AudioRedactionService:
             import shutil
             shutil.copy(input_path, output_path)
 
-        return {
-            "status": "success",
-            "original_filename": filename,
-            "redacted_filename": output_filename,
-            "redacted_file_path": output_path,
-            "method": "Audio Redaction (Whisper + Presidio + Bleep)"
-        }
-
     def _analyze_audio_file(self, input_path):
-        if self.model is None:
-            self.model = whisper.load_model("base")
-            
+        model = model_registry.get_whisper()
+
         # Transcribe with word timestamps
-        result = self.model.transcribe(input_path, word_timestamps=True)
+        result = model.transcribe(input_path, word_timestamps=True)
         segments = result["segments"]
 
         # Identify sensitive segments
@@ -0,0 +1,46 @@
+from typing import List, Optional
+from presidio_analyzer.nlp_engine import NlpArtifacts
+from services import model_registry
+
+
+class DocumentAnalysis:
+    """The spaCy parse of one text, in the form Presidio's analyzer takes it."""
+
+    def __init__(self, text: str, doc, model_name: str = model_registry.DEFAULT_SPACY_MODEL):
+        self.text = text
+        self.doc = doc
+        self.model_name = model_name
+        self._nlp_artifacts = None
+
+    @property
+    def nlp_artifacts(self) -> NlpArtifacts:
+        if self._nlp_artifacts is None:
+            nlp_engine = model_registry.get_nlp_engine(self.model_name)
+            # Same conversion Presidio applies after its own parse, so the label
+            # mapping and scores match what AnalyzerEngine.analyze would produce
+            self._nlp_artifacts = nlp_engine._doc_to_nlp_artifact(self.doc, "en")
+        return self._nlp_artifacts
+
+
+def analyze_document(text: str, model_name: str = model_registry.DEFAULT_SPACY_MODEL, ner: bool = True) -> DocumentAnalysis:
+    """
+    Run the spaCy pipeline over text once. With ner=False the entity
+    recognizer and parser are skipped; the tagger and lemmatizer still run
+    because Presidio's context enhancer matches context words by lemma.
+    """
+    nlp = model_registry.get_spacy(model_name)
+    if ner:
+        doc = nlp(text)
+    else:
+        doc = nlp(text, disable=[name for name in ("ner", "parser") if name in nlp.pipe_names])
+    return DocumentAnalysis(text, doc, model_name)
+
+
+def run_analyzer(analyzer, text: str, entities: Optional[List[str]] = None) -> list:
+    """
+    Run a Presidio analyzer on text, parsed with the analyzer's own pipeline.
+    Analyzers without NER-based recognizers get a parse without the entity
+    recognizer.
+    """
+    analysis = analyze_document(text, model_registry.pipeline_name(analyzer), ner=model_registry.uses_ner(analyzer))
+    return analyzer.analyze(text=text, language='en', entities=entities, nlp_artifacts=analysis.nlp_artifacts)
@@ -0,0 +1,296 @@
+import io
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+from typing import IO, Callable, Iterator, List, NamedTuple, Optional
+
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+W = "{" + W_NS + "}"
+# Alternate-content fallbacks repeat text boxes in legacy VML form
+MC_FALLBACK = "{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback"
+
+# Parts of a DOCX package that carry document text, in reading order
+_PART_ORDER = [
+    re.compile(r"^word/document\d*\.xml$"),
+    re.compile(r"^word/header\d*\.xml$"),
+    re.compile(r"^word/footer\d*\.xml$"),
+    re.compile(r"^word/footnotes\.xml$"),
+    re.compile(r"^word/endnotes\.xml$"),
+]
+
+
+class DocxBlock(NamedTuple):
+    """One paragraph of text and where it came from."""
+    part: str   # package part, e.g. "word/document.xml" or "word/header1.xml"
+    index: int  # paragraph position within that part, in document order
+    text: str
+
+
+def text_parts(names: List[str], patterns: List[re.Pattern] = _PART_ORDER) -> List[str]:
+    parts = []
+    for pattern in patterns:
+        parts.extend(sorted(name for name in names if pattern.match(name)))
+    return parts
+
+
+def iter_docx_blocks(content: bytes) -> Iterator[DocxBlock]:
+    """
+    Stream paragraphs out of a DOCX without building the python-docx object
+    model. Covers the body, tables, text boxes, headers, footers, footnotes
+    and endnotes.
+    """
+    with zipfile.ZipFile(io.BytesIO(content)) as package:
+        for part in text_parts(package.namelist()):
+            with package.open(part) as stream:
+                yield from _iter_part_blocks(part, stream)
+
+
+def _iter_part_blocks(part: str, stream: IO[bytes]) -> Iterator[DocxBlock]:
+    open_elements = []
+    # Text of each open paragraph; text-box paragraphs nest inside a run of another
+    paragraphs: List[List[str]] = []
+    table_depth = 0
+    fallback_depth = 0
+    in_tab_stops = False
+    index = 0
+
+    for event, elem in ET.iterparse(stream, events=("start", "end")):
+        tag = elem.tag
+        if event == "start":
+            open_elements.append(elem)
+            if tag == MC_FALLBACK:
+                fallback_depth += 1
+            elif fallback_depth:
+                continue
+            elif tag == W + "p":
+                paragraphs.append([])
+            elif tag == W + "tbl":
+                table_depth += 1
+            elif tag == W + "tabs":
+                in_tab_stops = True
+            continue
+
+        open_elements.pop()
+        if tag == MC_FALLBACK:
+            fallback_depth -= 1
+            continue
+        if fallback_depth:
+            continue
+
+        if tag == W + "t":
+            if paragraphs:
+                paragraphs[-1].append(elem.text or "")
+        elif tag == W + "tab":
+            # w:tab is also used for tab-stop definitions in paragraph properties
+            if paragraphs and not in_tab_stops:
+                paragraphs[-1].append("\t")
+        elif tag in (W + "br", W + "cr"):
+            if paragraphs:
+                paragraphs[-1].append("\n")
+        elif tag == W + "tabs":
+            in_tab_stops = False
+        elif tag == W + "tbl":
+            table_depth -= 1
+        elif tag == W + "p":
+            yield DocxBlock(part, index, "".join(paragraphs.pop()))
+            index += 1
+
+        # Drop finished top-level content so memory stays bounded on large parts
+        if tag in (W + "p", W + "tbl") and not paragraphs and not table_depth and open_elements:
+            open_elements[-1].clear()
+
+
+REDACTION_BLOCK = "████████"
+XML_SPACE = "{http://www.w3.org/XML/1998/namespace}space"
+W15 = "{http://schemas.microsoft.com/office/word/2012/wordml}"
+REL_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+# Comments aren't part of the reading text but are shipped with the file
+_REDACTED_TEXT_PARTS = _PART_ORDER + [re.compile(r"^word/comments\.xml$")]
+# Element text that isn't displayed but still carries content: tracked
+# deletions and field codes (HYPERLINK "mailto:..."); w:fldSimple holds the
+# same field codes in its w:instr attribute
+_HIDDEN_TEXT = (W + "delText", W + "instrText")
+# Names of people: comment and revision authors, and the people part
+_PERSON_ATTRS = (W + "author", W + "initials", W15 + "author", W15 + "userId")
+_PEOPLE_PART = "word/people.xml"
+# Free-text document properties, blanked by local name
+_PROPERTY_FIELDS = {
+    "docProps/core.xml": {"creator", "lastModifiedBy", "title", "subject", "description",
+                          "keywords", "category", "contentStatus", "identifier"},
+    "docProps/app.xml": {"Company", "Manager", "HyperlinkBase", "lpstr", "lpwstr"},
+    "docProps/custom.xml": {"lpstr", "lpwstr", "bstr"},
+}
+
+
+def _relationships_part(part: str) -> str:
+    folder, name = part.rsplit("/", 1)
+    return f"{folder}/_rels/{name}.rels"
+
+
+def redacted_parts(names: List[str]) -> List[str]:
+    """Parts redact_docx_package rewrites; every other part is copied through."""
+    parts = text_parts(names, _REDACTED_TEXT_PARTS)
+    parts += [rels for rels in map(_relationships_part, parts) if rels in names]
+    parts += [name for name in [_PEOPLE_PART, *_PROPERTY_FIELDS] if name in names]
+    return parts
+
+
+def _paragraph_pieces(paragraph) -> List[tuple]:
+    """(text element or None, text) for one paragraph, excluding nested text-box paragraphs."""
+    pieces = []
+
+    def walk(parent):
+        for child in parent:
+            tag = child.tag
+            if tag == W + "p":
+                continue
+            if tag == W + "t" or tag in _HIDDEN_TEXT:
+                pieces.append((child, child.text or ""))
+            elif tag == W + "fldSimple":
+                # A simple field keeps its field code in an attribute
+                pieces.append((child, child.get(W + "instr") or ""))
+                walk(child)
+            elif tag == W + "tab" and parent.tag == W + "r":
+                pieces.append((None, "\t"))
+            elif tag in (W + "br", W + "cr"):
+                pieces.append((None, "\n"))
+            else:
+                walk(child)
+
+    walk(paragraph)
+    return pieces
+
+
+def _redact_piece(piece_text: str, piece_start: int, merged: List[List[int]], replacement: str) -> Optional[str]:
+    """The piece with the merged spans that overlap it replaced, or None if none do."""
+    piece_end = piece_start + len(piece_text)
+    overlapping = [(s, e) for s, e in merged if s < piece_end and e > piece_start]
+    if not overlapping:
+        return None
+
+    out = []
+    cursor = piece_start
+    for s, e in overlapping:
+        local_start = max(s, piece_start)
+        out.append(piece_text[cursor - piece_start:local_start - piece_start])
+        # The block goes where the entity starts; its other fragments are dropped
+        if s >= piece_start:
+            out.append(replacement)
+        cursor = min(e, piece_end)
+    out.append(piece_text[cursor - piece_start:])
+    return "".join(out)
+
+
+def _hyperlink_targets(rels) -> list:
+    return [
+        rel for rel in rels.iter(REL_NS + "Relationship")
+        if rel.get("TargetMode") == "External" and rel.get("Type", "").endswith("/hyperlink")
+    ]
+
+
+def _scrub_metadata(name: str, tree) -> int:
+    """Blank people's names and free-text properties in one part. Returns the number of values blanked."""
+    from lxml import etree
+
+    blanked = 0
+    fields = _PROPERTY_FIELDS.get(name)
+    for elem in tree.iter(tag=etree.Element):
+        if fields is not None:
+            if elem.text and etree.QName(elem).localname in fields:
+                elem.text = ""
+                blanked += 1
+            continue
+        for attr in _PERSON_ATTRS:
+            if elem.get(attr):
+                elem.set(attr, "")
+                blanked += 1
+    return blanked
+
+
+def redact_docx_package(content: bytes, analyze: Callable[[str], list], replacement: str = REDACTION_BLOCK) -> bytes:
+    """
+    Redact a DOCX in place. Text from every text part and the comments, with
+    tracked deletions and field codes, is analyzed together, then only the
+    elements that overlap an entity are rewritten. External hyperlink targets
+    that contain an entity are replaced, and comment/revision authors and
+    free-text document properties are blanked. Every other part and element
+    is copied through untouched.
+    `analyze` takes the text and returns results with .start and .end.
+    """
+    from lxml import etree
+
+    parser = etree.XMLParser(huge_tree=True, remove_blank_text=False)
+    with zipfile.ZipFile(io.BytesIO(content)) as package:
+        infos = package.infolist()
+        names = [info.filename for info in infos]
+        parts = text_parts(names, _REDACTED_TEXT_PARTS)
+        trees = {part: etree.fromstring(package.read(part), parser) for part in redacted_parts(names)}
+        others = {info.filename: package.read(info.filename) for info in infos if info.filename not in trees}
+
+    # One text for the whole package so the analyzer runs once, with context
+    pieces = []  # (element, global start, text)
+    text_parts_list = []
+    pos = 0
+    for part in parts:
+        for paragraph in trees[part].iter(W + "p"):
+            for element, piece_text in _paragraph_pieces(paragraph):
+                pieces.append((element, pos, piece_text))
+                text_parts_list.append(piece_text)
+                pos += len(piece_text)
+            text_parts_list.append("\n")
+            pos += 1
+    # Hyperlink targets go last, one per line
+    links = []  # (relationship, global start, target)
+    for part in parts:
+        rels = trees.get(_relationships_part(part))
+        for rel in _hyperlink_targets(rels) if rels is not None else []:
+            target = rel.get("Target") or ""
+            links.append((rel, pos, target))
+            text_parts_list.append(target + "\n")
+            pos += len(target) + 1
+    text = "".join(text_parts_list)
+
+    spans = sorted((r.start, r.end) for r in analyze(text))
+    merged: List[List[int]] = []
+    for start, end in spans:
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+
+    changed = 0
+    for element, piece_start, piece_text in pieces:
+        if element is None or not piece_text:
+            continue
+        redacted = _redact_piece(piece_text, piece_start, merged, replacement)
+        if redacted is None:
+            continue
+        if element.tag == W + "fldSimple":
+            element.set(W + "instr", redacted)
+        else:
+            element.text = redacted
+            element.set(XML_SPACE, "preserve")
+        changed += 1
+
+    for rel, target_start, target in links:
+        target_end = target_start + len(target)
+        if any(s < target_end and e > target_start for s, e in merged):
+            # Block characters aren't valid in a URI, so the whole target goes
+            rel.set("Target", "#")
+            changed += 1
+
+    blanked = sum(_scrub_metadata(name, tree) for name, tree in trees.items())
+
+    print(f"DEBUG: DOCX redaction: {len(merged)} spans, {changed} text runs rewritten, {blanked} names and properties blanked", flush=True)
+
+    output = io.BytesIO()
+    with zipfile.ZipFile(output, "w") as out_package:
+        for info in infos:
+            if info.filename in trees:
+                data = etree.tostring(trees[info.filename], xml_declaration=True, encoding="UTF-8", standalone=True)
+            else:
+                data = others[info.filename]
+            # Reusing the ZipInfo keeps entry order and compression settings
+            out_package.writestr(info, data)
+    return output.getvalue()
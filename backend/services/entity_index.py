@@ -0,0 +1,43 @@
+import os
+import re
+import hmac
+import hashlib
+from typing import Dict, List, Optional
+
+# Values are indexed as keyed hashes so the index never holds raw PII and short
+# value spaces (card numbers, SSNs) can't be brute-forced without the key
+INDEX_KEY = os.getenv("ENTITY_INDEX_KEY", "")
+if not INDEX_KEY:
+    print("Warning: ENTITY_INDEX_KEY not set. Entity index hashes are unkeyed.")
+
+# Entity types whose formatting (spaces, dashes, dots) carries no meaning
+_DIGIT_LIKE = {"CREDIT_CARD", "PHONE_NUMBER", "US_SSN", "US_ITIN", "US_BANK_NUMBER", "IBAN_CODE", "US_PASSPORT", "US_DRIVER_LICENSE"}
+
+
+def normalize_value(entity_type: str, value: str) -> str:
+    if entity_type in _DIGIT_LIKE:
+        return re.sub(r"[^0-9a-z]", "", value.lower())
+    return " ".join(value.lower().split())
+
+
+def value_hash(entity_type: str, value: str) -> str:
+    normalized = f"{entity_type}:{normalize_value(entity_type, value)}"
+    return hmac.new(INDEX_KEY.encode("utf-8"), normalized.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def build_index_rows(document_id: int, user_id: Optional[str], text: str, spans: List[list]) -> List[Dict]:
+    """One row per distinct (entity type, normalized value) found in a document."""
+    seen = set()
+    rows = []
+    for entity_type, start, end, _score in spans:
+        key = (entity_type, value_hash(entity_type, text[start:end]))
+        if key in seen:
+            continue
+        seen.add(key)
+        rows.append({
+            "document_id": document_id,
+            "user_id": user_id,
+            "entity_type": key[0],
+            "value_hash": key[1],
+        })
+    return rows
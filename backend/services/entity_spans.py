@@ -0,0 +1,81 @@
+import re
+from typing import Dict, List, Optional
+from presidio_analyzer import RecognizerResult
+from presidio_anonymizer.entities import OperatorConfig
+
+BLOCK = "████████"
+
+# Gap across which Presidio's anonymizer joins two entities of the same type
+_SPACES_ONLY = re.compile(r"( )+")
+
+# Replacement styles that can be applied to stored spans without re-running NER
+REPLACEMENT_STYLES: Dict[str, Dict[str, OperatorConfig]] = {
+    "block": {"DEFAULT": OperatorConfig("replace", {"new_value": BLOCK})},
+    # "replace" without a new_value writes the entity type, e.g. <PERSON>
+    "tag": {"DEFAULT": OperatorConfig("replace", {})},
+    "mask": {"DEFAULT": OperatorConfig("mask", {"masking_char": "*", "chars_to_mask": 10000, "from_end": False})},
+    "hash": {"DEFAULT": OperatorConfig("hash", {"hash_type": "sha256"})},
+}
+
+
+def encode_spans(results: List[RecognizerResult]) -> List[list]:
+    """Compact, JSON-friendly form of analyzer results: [type, start, end, score]."""
+    return [[r.entity_type, r.start, r.end, round(r.score, 3)] for r in results]
+
+
+def decode_spans(spans: Optional[List[list]], entities: Optional[List[str]] = None, score_threshold: float = 0.0) -> List[RecognizerResult]:
+    """Rebuild analyzer results from stored spans, keeping only the selected entities and scores."""
+    wanted = set(entities) if entities else None
+    results = []
+    for entity_type, start, end, score in spans or []:
+        if wanted is not None and entity_type not in wanted:
+            continue
+        if score < score_threshold:
+            continue
+        results.append(RecognizerResult(entity_type=entity_type, start=start, end=end, score=score))
+    return results
+
+
+def resolve_results(text: str, results: List[RecognizerResult]) -> List[RecognizerResult]:
+    """
+    Sorted, non-overlapping copies of `results`, ready for the anonymizer:
+    overlapping spans are merged under the type of the one that starts first,
+    and same-type spans separated only by spaces are joined, as Presidio's
+    anonymizer would join them. Given these, the anonymizer has nothing left
+    to merge or drop, so its output is exactly these ranges replaced.
+    """
+    resolved: List[RecognizerResult] = []
+    for result in sorted(results, key=lambda r: (r.start, -r.end)):
+        if result.end <= result.start:
+            continue
+        if resolved:
+            last = resolved[-1]
+            joins_last = result.start < last.end or (
+                result.entity_type == last.entity_type and _SPACES_ONLY.fullmatch(text, last.end, result.start)
+            )
+            if joins_last:
+                last.end = max(last.end, result.end)
+                last.score = max(last.score, result.score)
+                continue
+        resolved.append(RecognizerResult(entity_type=result.entity_type, start=result.start, end=result.end, score=result.score))
+    return resolved
+
+
+def redaction_ranges(text: str, spans: Optional[List[list]], entities: Optional[List[str]] = None, score_threshold: float = 0.0) -> List[list]:
+    """
+    The [start, end, type] ranges a client replaces to render the redacted
+    text: the same resolved ranges RedactionService.anonymize replaces.
+    """
+    return [[r.start, r.end, r.entity_type] for r in resolve_results(text, decode_spans(spans, entities, score_threshold))]
+
+
+def render_ranges(text: str, ranges: List[list], replacement: str) -> str:
+    """Inverse of the spans response format: original text with each range replaced."""
+    pieces = []
+    cursor = 0
+    for start, end, _entity_type in ranges:
+        pieces.append(text[cursor:start])
+        pieces.append(replacement)
+        cursor = end
+    pieces.append(text[cursor:])
+    return "".join(pieces)
@@ -1,69 +1,209 @@
 import pandas as pd
-from services.rules_engine import redact_text_selectively
+from typing import Iterator, List, Optional
+from services.rules_engine import get_user_rules, redact_texts_selectively
 import os
 
-# 1. Process a Dataset (e.g., CSV)
-def process_dataset(input_file, output_file, text_column, user_id):
-    print(f"Loading {input_file} for user {user_id}...")
-    
-    # Determine file type
+# Rows read, cleaned and written at a time. Peak memory follows this, not the file size.
+DATASET_CHUNK_ROWS = int(os.getenv("DATASET_CHUNK_ROWS", "10000"))
+
+# Rows looked at to auto-detect the text column
+SAMPLE_ROWS = 100
+
+COMMON_TEXT_COLUMNS = ['chat_transcript', 'text', 'content', 'body', 'response', 'question', 'answer', 'prompt', 'completion']
+
+
+def _check_format(input_file: str):
+    if not input_file.endswith(('.csv', '.jsonl', '.json', '.parquet')):
+        raise ValueError("Unsupported file format. Please upload CSV, JSONL or Parquet.")
+
+
+def read_sample(input_file: str, rows: int = SAMPLE_ROWS) -> pd.DataFrame:
+    """The first rows of a dataset, for column detection."""
+    _check_format(input_file)
+    if input_file.endswith('.csv'):
+        return pd.read_csv(input_file, nrows=rows)
+    if input_file.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(input_file)
+        batch = next(parquet_file.iter_batches(batch_size=rows), None)
+        return batch.to_pandas() if batch is not None else parquet_file.schema_arrow.empty_table().to_pandas()
+    if _is_json_array(input_file):
+        return pd.read_json(input_file).head(rows)
+    return pd.read_json(input_file, lines=True, nrows=rows)
+
+
+def iter_chunks(input_file: str, chunk_rows: int = DATASET_CHUNK_ROWS, columns: Optional[List[str]] = None) -> Iterator[pd.DataFrame]:
+    """Read a CSV or JSONL dataset `chunk_rows` rows at a time, optionally only `columns`."""
+    _check_format(input_file)
     if input_file.endswith('.csv'):
-        df = pd.read_csv(input_file)
-    elif input_file.endswith('.jsonl') or input_file.endswith('.json'):
-        try:
-            # Try reading as JSONL (lines=True)
-            df = pd.read_json(input_file, lines=True)
-        except ValueError:
-            # Fallback: Try reading as standard JSON array
-            print("JSONL parsing failed, trying standard JSON...")
-            df = pd.read_json(input_file)
+        yield from pd.read_csv(input_file, chunksize=chunk_rows, usecols=columns)
+        return
+
+    if _is_json_array(input_file):
+        # A standard JSON array can't be read in pieces
+        print("Input is a JSON array, reading it whole...")
+        chunks = [pd.read_json(input_file)]
     else:
-        raise ValueError("Unsupported file format. Please upload CSV or JSONL.")
-    
-    # Smart Column Detection
-    if text_column not in df.columns:
-        print(f"Column '{text_column}' not found. Attempting auto-detection...")
-        
-        # 1. Try common variations
-        common_names = ['chat_transcript', 'text', 'content', 'body', 'response', 'question', 'answer', 'prompt', 'completion']
-        found_col = None
-        for col in common_names:
-            if col in df.columns:
-                found_col = col
-                break
-        
-        # 2. If not found, try the first string column that has long-ish text (heuristic)
-        if not found_col:
-            for col in df.columns:
-                if df[col].dtype == 'object' or df[col].dtype == 'string':
-                    # Check first non-null value to see if it looks like text
-                    sample = df[col].dropna().iloc[0] if not df[col].dropna().empty else ""
-                    if isinstance(sample, str) and len(sample) > 10:
-                        found_col = col
-                        break
-        
-        if found_col:
-            print(f"Auto-detected text column: '{found_col}'")
-            text_column = found_col
-        else:
-            raise ValueError(f"Could not automatically detect a text column. Please specify one of: {list(df.columns)}")
+        # JSONL (lines=True)
+        chunks = pd.read_json(input_file, lines=True, chunksize=chunk_rows)
+    for chunk in chunks:
+        yield chunk[columns] if columns is not None else chunk
+
+
+def _is_json_array(input_file: str) -> bool:
+    with open(input_file, 'r', encoding='utf-8') as f:
+        while True:
+            char = f.read(1)
+            if not char or not char.isspace():
+                return char == '['
+
+
+def detect_text_column(sample: pd.DataFrame, text_column: str) -> str:
+    """Pick the column to clean, looking only at a sample of the rows (the first chunk)."""
+    if text_column in sample.columns:
+        return text_column
+
+    print(f"Column '{text_column}' not found. Attempting auto-detection...")
+
+    # 1. Try common variations
+    found_col = None
+    for col in COMMON_TEXT_COLUMNS:
+        if col in sample.columns:
+            found_col = col
+            break
+
+    # 2. If not found, try the first string column that has long-ish text (heuristic)
+    if not found_col:
+        for col in sample.columns:
+            if sample[col].dtype == 'object' or sample[col].dtype == 'string':
+                # Check first non-null value to see if it looks like text
+                values = sample[col].dropna()
+                first_value = values.iloc[0] if not values.empty else ""
+                if isinstance(first_value, str) and len(first_value) > 10:
+                    found_col = col
+                    break
+
+    if not found_col:
+        raise ValueError(f"Could not automatically detect a text column. Please specify one of: {list(sample.columns)}")
+    print(f"Auto-detected text column: '{found_col}'")
+    return found_col
+
+
+def clean_chunk(df: pd.DataFrame, text_column: str, user_id: str, rules: dict) -> pd.DataFrame:
+    # Clean the non-null rows with the rules engine; spaCy parses them in batches
+    texts = df[text_column]
+    present = texts.notna()
+    cleaned = texts.astype(object)
+    cleaned[present] = list(redact_texts_selectively((str(text) for text in texts[present]), user_id, rules=rules))
+    df[f'cleaned_{text_column}'] = cleaned
 
-    print(f"Cleaning column: '{text_column}'...")
-    
-    # Apply the cleaning function using the rules engine
-    # We use a lambda to pass the user_id to the redaction function
-    df[f'cleaned_{text_column}'] = df[text_column].apply(
-        lambda text: redact_text_selectively(str(text), user_id) if pd.notnull(text) else text
-    )
-    
     # Drop the original dirty column to be safe
-    df = df.drop(columns=[text_column])
-    
-    print(f"Saving to {output_file}...")
+    return df.drop(columns=[text_column])
+
+
+def write_chunk(df: pd.DataFrame, output_file: str, first: bool):
+    """Write the first chunk (with the CSV header) or append a later one."""
     if output_file.endswith('.csv'):
-        df.to_csv(output_file, index=False)
+        df.to_csv(output_file, index=False, mode='w' if first else 'a', header=first)
     elif output_file.endswith('.jsonl'):
-        df.to_json(output_file, orient='records', lines=True)
+        records = df.to_json(orient='records', lines=True)
+        with open(output_file, 'w' if first else 'a', encoding='utf-8') as f:
+            if records.strip():
+                f.write(records.rstrip('\n') + '\n')
+    elif output_file.endswith('.json'):
+        # One JSON array built up chunk by chunk; finish_output closes it.
+        # to_json escapes newlines inside values, so each line is one record.
+        records = df.to_json(orient='records', lines=True).strip()
+        with open(output_file, 'w' if first else 'a', encoding='utf-8') as f:
+            if first:
+                f.write('[')
+            if records:
+                if f.tell() > 1:
+                    f.write(',')
+                f.write('\n' + records.replace('\n', ',\n'))
+
+
+def finish_output(output_file: str):
+    """Close what write_chunk left open: the array of a .json output."""
+    if output_file.endswith('.json'):
+        with open(output_file, 'a', encoding='utf-8') as f:
+            f.write('\n]\n')
+
+
+def process_parquet(input_file: str, output_file: str, text_column: str, user_id: str, rules: dict,
+                    chunk_rows: int = DATASET_CHUNK_ROWS, columns: Optional[List[str]] = None) -> int:
+    """
+    Clean a Parquet file batch by batch in Arrow. Only `columns` are read, and
+    passthrough columns are copied as Arrow arrays without becoming Python
+    objects; only the text column is converted for the rules engine.
+    Returns the number of rows written.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(input_file)
+    writer = None
+    rows = 0
+    try:
+        for batch in parquet_file.iter_batches(batch_size=chunk_rows, columns=columns):
+            values = batch.column(text_column).to_pylist()
+            cleaned_present = iter(redact_texts_selectively((str(v) for v in values if v is not None), user_id, rules=rules))
+            cleaned = [next(cleaned_present) if v is not None else None for v in values]
+
+            # Drop the original dirty column to be safe
+            table = pa.Table.from_batches([batch]).drop_columns([text_column])
+            table = table.append_column(f'cleaned_{text_column}', pa.array(cleaned, type=pa.string()))
+            # The stored pandas metadata still describes the dropped column
+            table = table.replace_schema_metadata(None)
+
+            if writer is None:
+                writer = pq.ParquetWriter(output_file, table.schema)
+            writer.write_table(table)
+            rows += len(values)
+            print(f"Cleaned {rows} rows")
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+# 1. Process a Dataset (e.g., CSV)
+def process_dataset(input_file, output_file, text_column, user_id, chunk_rows: int = DATASET_CHUNK_ROWS,
+                    keep_columns: Optional[List[str]] = None):
+    """
+    Clean a dataset in chunks of `chunk_rows` rows: each chunk is read,
+    redacted and appended to the output before the next one is read.
+    With `keep_columns`, only those columns (plus the text column) are read
+    and written.
+    """
+    print(f"Loading {input_file} for user {user_id}...")
+
+    # Smart Column Detection, on a sample of the rows
+    text_column = detect_text_column(read_sample(input_file), text_column)
+    print(f"Cleaning column: '{text_column}'...")
+    columns = None
+    if keep_columns:
+        columns = [text_column] + [col for col in keep_columns if col != text_column]
+
+    # Rules are fetched fresh once for the whole job, not once per row
+    rules = get_user_rules(user_id, max_age=0)
+    print(f"Using rules version {rules['version']}")
+    print(f"Saving to {output_file}...")
+
+    if input_file.endswith('.parquet'):
+        rows = process_parquet(input_file, output_file, text_column, user_id, rules, chunk_rows, columns)
+    else:
+        rows = 0
+        chunks = 0
+        for chunk in iter_chunks(input_file, chunk_rows, columns):
+            write_chunk(clean_chunk(chunk, text_column, user_id, rules), output_file, first=chunks == 0)
+            chunks += 1
+            rows += len(chunk)
+            print(f"Cleaned {rows} rows ({chunks} chunks)")
+        if chunks:
+            finish_output(output_file)
+
+    if rows == 0:
+        raise ValueError("The dataset has no rows.")
     print("Done!")
     return output_file
-
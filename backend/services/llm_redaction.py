@@ -0,0 +1,127 @@
+import os
+import time
+import asyncio
+from typing import Awaitable, Callable, List, Optional, Tuple
+from openai import AsyncOpenAI
+from services.parallel_analysis import split_text
+
+LLM_MODEL = os.getenv("OPENAI_MODEL", "gpt-4")
+# Budget per chunk, leaving room in the context window for the prompt and the reply
+LLM_CHUNK_TOKENS = int(os.getenv("OPENAI_CHUNK_TOKENS", "2000"))
+LLM_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "4"))
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("OPENAI_REQUESTS_PER_MINUTE", "60"))
+LLM_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))
+
+# "full" sends every chunk to the LLM. "cascade" runs Presidio first and only
+# sends the chunks whose findings are uncertain or conflicting.
+LLM_REDACTION_MODE = os.getenv("OPENAI_REDACTION_MODE", "full")
+# In cascade mode, a finding scoring below this makes its chunk uncertain...
+CASCADE_ESCALATE_BELOW = float(os.getenv("CASCADE_ESCALATE_BELOW", "0.85"))
+# ...unless it also scores below this, which is treated as noise
+CASCADE_IGNORE_BELOW = float(os.getenv("CASCADE_IGNORE_BELOW", "0.3"))
+
+# Rough token estimate for English text; avoids a tokenizer dependency
+CHARS_PER_TOKEN = 4
+
+SYSTEM_PROMPT = "You are an advanced redaction engine. Your task is to redact ALL Personally Identifiable Information (PII) and sensitive data from the text. This includes but is not limited to: Names, Email Addresses, Phone Numbers, Physical Addresses, Dates, Times, Credit Card Numbers, Social Security Numbers, Passport Numbers, Driver's License Numbers, and IP Addresses. Replace each instance of sensitive data with the exact string '████████'. Do not describe what you redacted, just return the text with the redactions applied."
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def split_for_llm(text: str, max_tokens: int = LLM_CHUNK_TOKENS) -> List[str]:
+    """Split text into contiguous chunks of at most `max_tokens` (estimated) each."""
+    return [chunk for _, chunk in split_for_llm_with_offsets(text, max_tokens)]
+
+
+def split_for_llm_with_offsets(text: str, max_tokens: int = LLM_CHUNK_TOKENS) -> List[Tuple[int, str]]:
+    return split_text(text, chunk_size=max_tokens * CHARS_PER_TOKEN, overlap=0)
+
+
+def escalation_reason(results: list) -> Optional[str]:
+    """
+    Why a chunk's Presidio findings need a second opinion from the LLM, or None
+    if they can be trusted: "uncertain" when a finding scores between the
+    cascade thresholds, "ambiguous" when findings of different types overlap.
+    """
+    considered = [r for r in results if r.score >= CASCADE_IGNORE_BELOW]
+    if any(r.score < CASCADE_ESCALATE_BELOW for r in considered):
+        return "uncertain"
+
+    widest = None
+    for result in sorted(considered, key=lambda r: (r.start, -r.end)):
+        if widest is not None and result.start < widest.end and result.entity_type != widest.entity_type:
+            return "ambiguous"
+        if widest is None or result.end > widest.end:
+            widest = result
+    return None
+
+
+class RateLimiter:
+    """Spaces requests evenly so no more than `per_minute` start in any minute."""
+
+    def __init__(self, per_minute: int):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._next_slot = 0.0
+
+    async def acquire(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        wait = self._next_slot - now
+        self._next_slot = max(now, self._next_slot) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class LLMRedactor:
+    """
+    Redacts long documents by sending token-budgeted chunks to an
+    OpenAI-compatible chat API concurrently, then reassembling them in order.
+    Point OPENAI_BASE_URL at a local server (see mock_openai_server.py) to test.
+    """
+
+    def __init__(self, api_key: str, base_url: Optional[str] = None):
+        self.client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url or os.getenv("OPENAI_BASE_URL") or None,
+            timeout=LLM_TIMEOUT
+        )
+        self.model = LLM_MODEL
+        self._semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+        self._rate_limiter = RateLimiter(LLM_REQUESTS_PER_MINUTE)
+
+    async def redact(self, text: str, fallback: Callable[[str], Awaitable[str]]) -> str:
+        chunks = split_for_llm(text)
+        print(f"DEBUG: LLM redaction: {len(text)} chars in {len(chunks)} chunks", flush=True)
+        redacted = await asyncio.gather(*(self.redact_chunk(chunk, fallback) for chunk in chunks))
+        return "".join(redacted)
+
+    async def redact_chunk(self, chunk: str, fallback: Callable[[str], Awaitable[str]]) -> str:
+        body = chunk.strip()
+        if not body:
+            return chunk
+
+        # Models drop surrounding whitespace; put it back so chunks join cleanly
+        leading = chunk[:len(chunk) - len(chunk.lstrip())]
+        trailing = chunk[len(chunk.rstrip()):]
+
+        try:
+            async with self._semaphore:
+                await self._rate_limiter.acquire()
+                response = await self.client.chat.completions.create(
+                    model=self.model,
+                    messages=[
+                        {"role": "system", "content": SYSTEM_PROMPT},
+                        {"role": "user", "content": body}
+                    ],
+                    temperature=0
+                )
+            content = response.choices[0].message.content
+            if content is None:
+                raise ValueError("Empty completion")
+            return leading + content.strip() + trailing
+        except Exception as e:
+            print(f"OpenAI Error on chunk ({len(chunk)} chars), falling back to Presidio: {e}")
+            return await fallback(chunk)
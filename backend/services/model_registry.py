@@ -0,0 +1,174 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional
+import psutil
+
+# Process-wide registry of heavy models. Every service asks here instead of
+# building its own, so each model is loaded at most once per worker process.
+
+DEFAULT_SPACY_MODEL = "en_core_web_lg"
+# Named pipelines that load a model package with some components left out.
+# Any other name is loaded as a spaCy package of that name, in full.
+SPACY_PIPELINES = {
+    # Small model without the dependency parser, which no recognizer reads
+    "en_core_web_sm-ner": ("en_core_web_sm", ("parser",)),
+}
+DEFAULT_WHISPER_MODEL = "base"
+# How many pruned (entity-subset) analyzers to keep around
+MAX_PRUNED_ANALYZERS = int(os.getenv("MAX_PRUNED_ANALYZERS", "32"))
+
+_models: Dict[str, Any] = {}
+_pruned_analyzers: "OrderedDict[tuple, Any]" = OrderedDict()
+_stats: Dict[str, Dict] = {}
+# Re-entrant because the analyzer loads the spaCy pipeline it wraps
+_lock = threading.RLock()
+
+
+def _rss_bytes() -> int:
+    return psutil.Process(os.getpid()).memory_info().rss
+
+
+def _get_or_load(name: str, loader: Callable[[], Any]) -> Any:
+    model = _models.get(name)
+    if model is not None:
+        return model
+
+    with _lock:
+        model = _models.get(name)
+        if model is None:
+            print(f"DEBUG: Loading model '{name}'...", flush=True)
+            rss_before = _rss_bytes()
+            started = time.perf_counter()
+            model = loader()
+            _stats[name] = {
+                "name": name,
+                # RSS growth while loading; models loaded inside another load are
+                # also counted in the outer one
+                "resident_mb": round((_rss_bytes() - rss_before) / (1024 * 1024), 1),
+                "load_seconds": round(time.perf_counter() - started, 2),
+            }
+            _models[name] = model
+            print(f"DEBUG: Loaded model '{name}' ({_stats[name]['resident_mb']} MB)", flush=True)
+    return model
+
+
+def get_spacy(model_name: str = DEFAULT_SPACY_MODEL):
+    package, exclude = SPACY_PIPELINES.get(model_name, (model_name, ()))
+
+    def load():
+        import spacy
+        try:
+            return spacy.load(package, exclude=list(exclude))
+        except OSError:
+            print(f"Downloading {package}...")
+            from spacy.cli import download
+            download(package)
+            return spacy.load(package, exclude=list(exclude))
+
+    return _get_or_load(f"spacy:{model_name}", load)
+
+
+def get_nlp_engine(model_name: str = DEFAULT_SPACY_MODEL):
+    """Presidio NLP engine backed by the shared spaCy pipeline."""
+    def load():
+        from presidio_analyzer.nlp_engine import SpacyNlpEngine
+        engine = SpacyNlpEngine(models=[{"lang_code": "en", "model_name": model_name}])
+        # Hand the engine our pipeline instead of letting load() build another one
+        engine.nlp = {"en": get_spacy(model_name)}
+        # Lets run_analyzer parse with the same pipeline the analyzer was built on
+        engine.pipeline_name = model_name
+        return engine
+
+    return _get_or_load(f"presidio-nlp:{model_name}", load)
+
+
+def get_analyzer(model_name: str = DEFAULT_SPACY_MODEL, entities: Optional[Iterable[str]] = None, ner: bool = True):
+    """
+    Shared AnalyzerEngine. With `entities`, returns an analyzer whose registry
+    holds only the recognizers for those entity types, cached per entity set.
+    With ner=False, the NER-based recognizers are left out as well.
+    """
+    if entities or not ner:
+        return _get_pruned_analyzer(model_name, frozenset(entities or ()), ner)
+
+    def load():
+        from presidio_analyzer import AnalyzerEngine
+        return AnalyzerEngine(nlp_engine=get_nlp_engine(model_name), supported_languages=["en"])
+
+    return _get_or_load(f"presidio-analyzer:{model_name}", load)
+
+
+def _get_pruned_analyzer(model_name: str, entities: frozenset, ner: bool = True):
+    # An empty entity set keeps every entity type
+    key = (model_name, entities, ner)
+    with _lock:
+        analyzer = _pruned_analyzers.get(key)
+        if analyzer is not None:
+            _pruned_analyzers.move_to_end(key)
+            return analyzer
+
+        from presidio_analyzer import AnalyzerEngine, RecognizerRegistry
+        from presidio_analyzer.predefined_recognizers import SpacyRecognizer
+        nlp_engine = get_nlp_engine(model_name)
+        registry = RecognizerRegistry()
+        registry.load_predefined_recognizers(languages=["en"], nlp_engine=nlp_engine)
+        registry.recognizers = [
+            r for r in registry.recognizers
+            if (not entities or entities.intersection(r.supported_entities))
+            and (ner or not isinstance(r, SpacyRecognizer))
+        ]
+        analyzer = AnalyzerEngine(registry=registry, nlp_engine=nlp_engine, supported_languages=["en"])
+        print(f"DEBUG: Built pruned analyzer for {sorted(entities) or 'all entities'}{'' if ner else ' without NER'} on {model_name} ({len(registry.recognizers)} recognizers)", flush=True)
+
+        _pruned_analyzers[key] = analyzer
+        while len(_pruned_analyzers) > MAX_PRUNED_ANALYZERS:
+            _pruned_analyzers.popitem(last=False)
+        return analyzer
+
+
+def uses_ner(analyzer) -> bool:
+    """Whether any of the analyzer's recognizers reads spaCy's named entities."""
+    from presidio_analyzer.predefined_recognizers import SpacyRecognizer
+    return any(isinstance(r, SpacyRecognizer) for r in analyzer.registry.recognizers)
+
+
+def pipeline_name(analyzer) -> str:
+    """Name of the spaCy pipeline an analyzer from this registry runs on."""
+    return getattr(analyzer.nlp_engine, "pipeline_name", DEFAULT_SPACY_MODEL)
+
+
+def get_anonymizer():
+    def load():
+        from presidio_anonymizer import AnonymizerEngine
+        return AnonymizerEngine()
+
+    return _get_or_load("presidio-anonymizer", load)
+
+
+def get_whisper(model_name: str = DEFAULT_WHISPER_MODEL):
+    def load():
+        import whisper
+        return whisper.load_model(model_name)
+
+    return _get_or_load(f"whisper:{model_name}", load)
+
+
+def get_yolo(model_path: str):
+    def load():
+        from ultralytics import YOLO
+        return YOLO(model_path)
+
+    return _get_or_load(f"yolo:{os.path.basename(model_path)}", load)
+
+
+def memory_report() -> Dict:
+    """Resident memory attributed to each loaded model, plus the process total."""
+    with _lock:
+        models: List[Dict] = [dict(stats) for stats in _stats.values()]
+    return {
+        "pid": os.getpid(),
+        "process_resident_mb": round(_rss_bytes() / (1024 * 1024), 1),
+        "models": models,
+    }
@@ -0,0 +1,306 @@
+import os
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional, Tuple
+from presidio_analyzer import AnalyzerEngine, RecognizerResult
+from services import redaction_tiers
+
+# Documents at or above this many characters are analyzed in chunks
+CHUNKED_ANALYSIS_THRESHOLD = int(os.getenv("PRESIDIO_CHUNKED_THRESHOLD", "100000"))
+CHUNK_SIZE = int(os.getenv("PRESIDIO_CHUNK_SIZE", "20000"))
+# Characters shared by neighbouring chunks so entities on a boundary are seen whole
+CHUNK_OVERLAP = int(os.getenv("PRESIDIO_CHUNK_OVERLAP", "200"))
+# Each worker holds its own copy of every model it has used, and there is one
+# pool per API process, so the default stays small even on large machines
+ANALYSIS_WORKERS = int(os.getenv("PRESIDIO_ANALYSIS_WORKERS", str(min(4, os.cpu_count() or 1))))
+# PDFs with at least this many pages are redacted in page ranges across the pool
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "40"))
+# Seconds to wait for all of one document's pool tasks before giving up on them
+ANALYSIS_TIMEOUT = float(os.getenv("PRESIDIO_ANALYSIS_TIMEOUT", "600"))
+
+# Workers are started from a clean process rather than forked from this one:
+# the pool is created lazily from a request thread, and a fork taken while
+# another thread holds a lock (the model registry's, torch/OpenMP's) would
+# leave that lock held forever in the child.
+_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+# Preferred places to cut a chunk, best first
+_BOUNDARIES = ("\n\n", "\n", ". ", "? ", "! ", " ")
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+# Per-process RedactionService used by page-range workers
+_worker_service = None
+
+
+
+def split_text(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> List[Tuple[int, str]]:
+    """
+    Split text into (offset, chunk) pairs, cutting on paragraph or sentence
+    boundaries where possible. Consecutive chunks share `overlap` characters.
+    """
+    chunks = []
+    start = 0
+    length = len(text)
+    while start < length:
+        end = min(start + chunk_size, length)
+        if end < length:
+            end = _find_boundary(text, start, end, chunk_size)
+        chunks.append((start, text[start:end]))
+        if end >= length:
+            break
+
+        next_start = max(end - overlap, start + 1)
+        # Don't start the next chunk in the middle of a word
+        space = text.find(" ", next_start, end)
+        if space != -1:
+            next_start = space + 1
+        start = next_start
+    return chunks
+
+
+def _find_boundary(text: str, start: int, end: int, chunk_size: int) -> int:
+    # Only look in the second half of the window so chunks don't get tiny
+    window_start = start + chunk_size // 2
+    for sep in _BOUNDARIES:
+        idx = text.rfind(sep, window_start, end)
+        if idx != -1:
+            return idx + len(sep)
+    return end
+
+
+def _analyze_chunk(offset: int, chunk: str, entities: Optional[List[str]], tier: redaction_tiers.Tier) -> List[Tuple[str, int, int, float]]:
+    from services.document_analysis import run_analyzer
+    analyzer = redaction_tiers.get_analyzer(tier, entities)
+    results = run_analyzer(analyzer, chunk, entities)
+    # Plain tuples keep the payload sent back to the parent small and picklable
+    return [(r.entity_type, r.start + offset, r.end + offset, r.score) for r in results]
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            print(f"DEBUG: Starting analysis pool with {ANALYSIS_WORKERS} workers", flush=True)
+            _pool = ProcessPoolExecutor(
+                max_workers=ANALYSIS_WORKERS,
+                mp_context=multiprocessing.get_context(_START_METHOD)
+            )
+        return _pool
+
+
+def _reset_pool(terminate: bool = False):
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            if terminate:
+                # Stuck workers would otherwise keep running after shutdown()
+                for process in list((_pool._processes or {}).values()):
+                    process.terminate()
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+class AnalysisTimeoutError(TimeoutError):
+    pass
+
+
+def _wait_for(futures: list) -> list:
+    """
+    Results of `futures`, in order. Raises AnalysisTimeoutError (and replaces
+    the pool) if they aren't all done within ANALYSIS_TIMEOUT seconds.
+    """
+    deadline = time.monotonic() + ANALYSIS_TIMEOUT
+    try:
+        return [future.result(timeout=max(0.0, deadline - time.monotonic())) for future in futures]
+    except FuturesTimeoutError:
+        for future in futures:
+            future.cancel()
+        _reset_pool(terminate=True)
+        raise AnalysisTimeoutError(f"Analysis pool did not finish within {ANALYSIS_TIMEOUT:g} seconds.")
+
+
+def map_in_pool(fn, args_list: List[tuple]) -> Optional[list]:
+    """Run fn(*args) for each args tuple on the pool, in order. None if the pool is unavailable."""
+    try:
+        pool = _get_pool()
+        futures = [pool.submit(fn, *args) for args in args_list]
+        return _wait_for(futures)
+    except BrokenProcessPool as e:
+        print(f"Analysis pool failed: {e}")
+        _reset_pool()
+        return None
+
+
+def merge_results(spans: List[Tuple[str, int, int, float]]) -> List[RecognizerResult]:
+    """
+    Merge chunk-level spans (already in global offsets) into one result list.
+    Duplicates found in the overlap keep their best score, and spans cut short by a
+    chunk edge are dropped when the same entity was found whole in the next chunk.
+    """
+    best = {}
+    for entity_type, start, end, score in spans:
+        key = (entity_type, start, end)
+        if score > best.get(key, -1.0):
+            best[key] = score
+
+    merged = []
+    max_end_by_type = {}
+    for (entity_type, start, end), score in sorted(best.items(), key=lambda item: (item[0][1], -item[0][2])):
+        if end <= max_end_by_type.get(entity_type, -1):
+            continue
+        max_end_by_type[entity_type] = end
+        merged.append(RecognizerResult(entity_type=entity_type, start=start, end=end, score=score))
+    return merged
+
+
+def analyze_in_chunks(text: str, analyzer: AnalyzerEngine, entities: Optional[List[str]] = None, tier: Optional[redaction_tiers.Tier] = None) -> List[RecognizerResult]:
+    """
+    Analyze a large document by fanning its chunks out over a process pool.
+    Falls back to analyzing the chunks in this process if the pool is unavailable.
+    """
+    tier = tier or redaction_tiers.get_tier()
+    chunks = split_text(text)
+    print(f"DEBUG: Chunked analysis: {len(text)} chars in {len(chunks)} chunks", flush=True)
+
+    if len(chunks) > 1 and ANALYSIS_WORKERS > 1:
+        try:
+            pool = _get_pool()
+            futures = [pool.submit(_analyze_chunk, offset, chunk, entities, tier) for offset, chunk in chunks]
+            spans = []
+            for chunk_spans in _wait_for(futures):
+                spans.extend(chunk_spans)
+            return merge_results(spans)
+        except BrokenProcessPool as e:
+            print(f"Analysis pool failed, analyzing chunks in-process: {e}")
+            _reset_pool()
+
+    from services.document_analysis import run_analyzer
+    spans = []
+    for offset, chunk in chunks:
+        for r in run_analyzer(analyzer, chunk, entities):
+            spans.append((r.entity_type, r.start + offset, r.end + offset, r.score))
+    return merge_results(spans)
+
+
+def _get_worker_service():
+    global _worker_service
+    if _worker_service is None:
+        # Imported here to avoid a circular import; models come from this
+        # process's registry, loaded per tier on first use
+        from services.redaction import RedactionService
+        _worker_service = RedactionService(preload=False)
+    return _worker_service
+
+
+# Stand-in links put on a page range so redaction removes the same ones it
+# would have removed from the whole document
+_LINK_MARKER = "redact-link:"
+
+
+def _redact_page_range(part: bytes, link_rects: List[List[tuple]], entities: Optional[List[str]], tier: Optional[str] = None) -> Tuple[bytes, List[List[int]]]:
+    """
+    Redact `part`, a PDF holding one page range of the document, on this
+    worker's own fitz handle. `link_rects` has the rectangles of each page's
+    links in the source; returns the redacted range and, per page, the indexes
+    of the links that survived redaction.
+    """
+    import fitz
+    from services import pdf_ocr
+    service = _get_worker_service()
+    analyzer = service.get_analyzer(entities, tier)
+    with pdf_ocr.fitz_lock:
+        doc = fitz.open(stream=part, filetype="pdf")
+        try:
+            for page_num, rects in enumerate(link_rects):
+                page = doc[page_num]
+                for index, rect in enumerate(rects):
+                    page.insert_link({"kind": fitz.LINK_URI, "from": fitz.Rect(rect), "uri": f"{_LINK_MARKER}{index}"})
+
+            # Already on a pool worker, so scanned pages in this range are OCRed inline
+            scanned = [n for n in range(len(doc)) if pdf_ocr.needs_ocr(doc[n])]
+            ocr = pdf_ocr.ocr_layouts(part, doc, scanned, parallel=False) if scanned else {}
+
+            surviving = []
+            for page_num in range(len(doc)):
+                page = doc[page_num]
+                service.redact_pdf_page(page, analyzer, entities, layout=ocr.get(page_num))
+                uris = [link.get("uri") or "" for link in page.get_links()]
+                surviving.append([int(uri[len(_LINK_MARKER):]) for uri in uris if uri.startswith(_LINK_MARKER)])
+            # The parent inserts this range with links=False, so the stand-ins go no further
+            return doc.tobytes(garbage=2, deflate=True), surviving
+        finally:
+            doc.close()
+
+
+def page_ranges(page_count: int, workers: int) -> List[Tuple[int, int]]:
+    # A few ranges per worker keeps cores busy when some pages are denser than others
+    size = max(1, -(-page_count // (workers * 2)))
+    return [(start, min(start + size, page_count)) for start in range(0, page_count, size)]
+
+
+def should_parallelize_pdf(page_count: int) -> bool:
+    return ANALYSIS_WORKERS > 1 and page_count >= PDF_PARALLEL_MIN_PAGES
+
+
+def redact_pdf_in_parallel(source, entities: Optional[List[str]] = None, tier: Optional[str] = None) -> Optional[bytes]:
+    """
+    Redact a PDF in page ranges across the process pool and stitch the ranges
+    back together, restoring the outline, metadata and every page's links from
+    `source` (the open, unmodified document).
+    Returns None if the pool is unavailable so the caller can redact serially.
+    """
+    import fitz
+    from services import pdf_ocr
+    with pdf_ocr.fitz_lock:
+        page_count = len(source)
+        ranges = page_ranges(page_count, ANALYSIS_WORKERS)
+        # Each task carries a PDF of just its own pages, so what is sent to the
+        # pool adds up to about one copy of the file rather than one per range.
+        # Links are resolved here, where every target page exists.
+        source_links = [
+            [{k: v for k, v in link.items() if k not in ("xref", "id")} for link in page.get_links()]
+            for page in source
+        ]
+        tasks = [
+            (pdf_ocr.pages_pdf(source, list(range(start, end))), [[tuple(link["from"]) for link in links] for links in source_links[start:end]])
+            for start, end in ranges
+        ]
+    print(f"DEBUG: Parallel PDF redaction: {page_count} pages in {len(ranges)} ranges", flush=True)
+
+    try:
+        pool = _get_pool()
+        futures = [pool.submit(_redact_page_range, part, link_rects, entities, tier) for part, link_rects in tasks]
+        parts = _wait_for(futures)
+    except BrokenProcessPool as e:
+        print(f"Analysis pool failed, redacting PDF serially: {e}")
+        _reset_pool()
+        return None
+
+    # The lock is only taken once the pool is done, for stitching
+    with pdf_ocr.fitz_lock:
+        out = fitz.open()
+        try:
+            surviving = []
+            for part_bytes, part_surviving in parts:
+                with fitz.open(stream=part_bytes, filetype="pdf") as part:
+                    # Links are re-added below from the source; the range's own are stand-ins
+                    out.insert_pdf(part, links=False, annots=True)
+                surviving.extend(part_surviving)
+
+            for page, links, kept in zip(out, source_links, surviving):
+                for index in kept:
+                    page.insert_link(links[index])
+
+            toc = source.get_toc(simple=False)
+            if toc:
+                out.set_toc(toc)
+            if source.metadata:
+                out.set_metadata(source.metadata)
+            return out.tobytes(garbage=3, deflate=True)
+        finally:
+            out.close()
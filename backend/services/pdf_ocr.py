@@ -0,0 +1,146 @@
+import os
+import hashlib
+import threading
+from typing import Dict, List, Optional, Tuple
+import fitz # PyMuPDF
+from services.result_cache import ResultCache
+
+# OCR runs through PyMuPDF's Tesseract integration (needs the tesseract-ocr
+# package and TESSDATA_PREFIX), only on pages without a usable text layer.
+OCR_ENABLED = os.getenv("PDF_OCR_ENABLED", "true").lower() == "true"
+OCR_LANGUAGE = os.getenv("PDF_OCR_LANGUAGE", "eng")
+OCR_DPI = int(os.getenv("PDF_OCR_DPI", "300"))
+# A page with images and less text than this is treated as scanned
+OCR_MIN_TEXT_CHARS = int(os.getenv("PDF_OCR_MIN_TEXT_CHARS", "20"))
+
+# Pages are examined in windows so OCR can run in parallel while output stays lazy
+OCR_WINDOW_PAGES = int(os.getenv("PDF_OCR_WINDOW_PAGES", "16"))
+
+_cache = ResultCache(
+    max_entries=int(os.getenv("OCR_CACHE_SIZE", "512")),
+    disk_dir=os.getenv("OCR_CACHE_DIR") or None
+)
+
+# PyMuPDF does not support being used from several threads at once, and the
+# text pool runs PDF work on several. Every fitz call in a process holds this
+# lock; re-entrant so helpers can take it inside a caller's critical section.
+fitz_lock = threading.RLock()
+
+# rawdict_layout skips image blocks, so there is no point decoding them
+RAWDICT_FLAGS = fitz.TEXTFLAGS_RAWDICT & ~fitz.TEXT_PRESERVE_IMAGES
+
+Layout = Tuple[str, List[Optional[tuple]]]
+
+
+def rawdict_layout(raw: dict) -> Layout:
+    """
+    Build a page's text from its character boxes in one pass. Returns the text
+    and a parallel list holding each character's bbox (None for the line and
+    block breaks added between lines), so text offsets map straight to boxes.
+    """
+    chars = []
+    boxes = []
+    for block in raw["blocks"]:
+        if block.get("type") != 0:
+            continue
+        for line in block["lines"]:
+            for span in line["spans"]:
+                for char in span["chars"]:
+                    chars.append(char["c"])
+                    boxes.append(tuple(char["bbox"]))
+            chars.append("\n")
+            boxes.append(None)
+        chars.append("\n")
+        boxes.append(None)
+    return "".join(chars), boxes
+
+
+def needs_ocr(page, text: Optional[str] = None) -> bool:
+    # Image check first: it is cheap and rules out most text-only pages
+    if not OCR_ENABLED or not page.get_images(full=False):
+        return False
+    if text is None:
+        text = page.get_text()
+    return len(text.strip()) < OCR_MIN_TEXT_CHARS
+
+
+def page_hash(doc, page) -> str:
+    """Hash of what OCR sees on a page: its content stream and image data, plus OCR settings."""
+    digest = hashlib.sha256(f"{OCR_LANGUAGE}:{OCR_DPI}".encode("utf-8"))
+    digest.update(page.read_contents() or b"")
+    for image in page.get_images(full=True):
+        digest.update(doc.xref_stream_raw(image[0]) or b"")
+    return digest.hexdigest()
+
+
+def ocr_page(page) -> Layout:
+    # get_text reuses the textpage as built, so the flags have to go here
+    textpage = page.get_textpage_ocr(flags=RAWDICT_FLAGS, language=OCR_LANGUAGE, dpi=OCR_DPI, full=True)
+    return rawdict_layout(page.get_text("rawdict", textpage=textpage))
+
+
+def pages_pdf(doc, page_numbers: List[int]) -> bytes:
+    """A PDF holding only the given pages of `doc`, in order, with their geometry unchanged."""
+    part = fitz.open()
+    try:
+        for page_num in page_numbers:
+            part.insert_pdf(doc, from_page=page_num, to_page=page_num, links=False)
+        return part.tobytes(garbage=2)
+    finally:
+        part.close()
+
+
+def _ocr_pages(content: bytes, page_numbers: List[int]) -> List[dict]:
+    # Runs in a pool worker on its own document handle
+    with fitz_lock:
+        doc = fitz.open(stream=content, filetype="pdf")
+        try:
+            layouts = []
+            for page_num in page_numbers:
+                text, boxes = ocr_page(doc[page_num])
+                layouts.append({"text": text, "boxes": boxes})
+            return layouts
+        finally:
+            doc.close()
+
+
+def ocr_layouts(content: bytes, doc, page_numbers: List[int], parallel: bool = True) -> Dict[int, Layout]:
+    """
+    OCR the given pages, reusing cached results by page hash. Uncached pages are
+    spread over the process pool when there is more than one; `doc` is only
+    touched under fitz_lock, which is not held while waiting on the pool.
+    """
+    layouts: Dict[int, Layout] = {}
+    missing = []
+    with fitz_lock:
+        keys = [(page_num, page_hash(doc, doc[page_num])) for page_num in page_numbers]
+    for page_num, key in keys:
+        cached = _cache.get(key)
+        if cached is not None:
+            layouts[page_num] = (cached["text"], [tuple(b) if b else None for b in cached["boxes"]])
+        else:
+            missing.append((page_num, key))
+
+    if not missing:
+        return layouts
+    print(f"DEBUG: OCR on {len(missing)} pages ({len(page_numbers) - len(missing)} cached)", flush=True)
+
+    computed = None
+    if parallel and len(missing) > 1:
+        from services import parallel_analysis
+        pages = [page_num for page_num, _ in missing]
+        groups = [pages[start:end] for start, end in parallel_analysis.page_ranges(len(pages), parallel_analysis.ANALYSIS_WORKERS)]
+        # A few tasks per worker, each carrying a PDF of just its own pages, so
+        # what is sent to the pool grows with the scanned pages, not pages x file size
+        with fitz_lock:
+            tasks = [(pages_pdf(doc, group), list(range(len(group)))) for group in groups]
+        results = parallel_analysis.map_in_pool(_ocr_pages, tasks)
+        if results is not None:
+            computed = [layout for group_layouts in results for layout in group_layouts]
+    if computed is None:
+        computed = _ocr_pages(content, [page_num for page_num, _ in missing])
+
+    for (page_num, key), layout in zip(missing, computed):
+        _cache.put(key, layout)
+        layouts[page_num] = (layout["text"], [tuple(b) if b else None for b in layout["boxes"]])
+    return layouts
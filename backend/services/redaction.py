@@ -1,111 +1,303 @@
 import os
 import io
-from typing import List
+import time
+import asyncio
+import threading
+from typing import AsyncIterator, Iterable, Iterator, List, Optional, Tuple
 from fastapi import UploadFile
-from presidio_analyzer import AnalyzerEngine
-from presidio_anonymizer import AnonymizerEngine
-from presidio_anonymizer.entities import OperatorConfig
 from dotenv import load_dotenv
-from openai import OpenAI
-import pypdf
-import docx
 import fitz # PyMuPDF
+from services import model_registry, parallel_analysis, pdf_ocr, redaction_tiers, worker_pools
+from services.worker_pools import PoolSaturatedError
+from presidio_analyzer import RecognizerResult
+from services import llm_redaction
+from services.llm_redaction import LLMRedactor
+from services.document_analysis import run_analyzer
+from services.result_cache import ResultCache, make_key
+from services.docx_processing import iter_docx_blocks, redact_docx_package
+from services.entity_spans import REPLACEMENT_STYLES, decode_spans, encode_spans, resolve_results
 
 load_dotenv()
 
+# Bump when a change to extraction or analysis should invalidate cached results
+ENGINE_VERSION = "presidio-2.2.354/en_core_web_lg/7"
+
+# Limits on what a single PDF may expand to during text extraction
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "2000"))
+PDF_MAX_TEXT_CHARS = int(os.getenv("PDF_MAX_TEXT_CHARS", "20000000"))
+# Non-PDF documents are streamed in pieces of about this many characters
+STREAM_TEXT_CHUNK_CHARS = int(os.getenv("STREAM_TEXT_CHUNK_CHARS", "5000"))
+
+
+class DocumentTooLargeError(ValueError):
+    pass
+
+
+def parse_entities(value: Optional[str], supported: Optional[Iterable[str]] = None) -> Optional[List[str]]:
+    """
+    Turn a comma-separated form field into a sorted entity list (None means all).
+    With `supported`, raises ValueError for any name outside it.
+    """
+    if not value:
+        return None
+    entities = sorted({e.strip().upper() for e in value.split(",") if e.strip()})
+    if supported is not None:
+        supported = set(supported)
+        unknown = [e for e in entities if e not in supported]
+        if unknown:
+            raise ValueError(f"Unknown entity types: {unknown}. See GET /entities for the supported ones.")
+    return entities or None
+
+
+def iter_pdf_pages(content: bytes, max_pages: Optional[int] = None, max_chars: Optional[int] = None) -> Iterator[str]:
+    """
+    Lazily yield the text of each PDF page using PyMuPDF. Scanned pages (images
+    with no text layer) are OCRed, a window of pages at a time in parallel.
+    Raises DocumentTooLargeError once the page or extracted-text cap is exceeded.
+    """
+    max_pages = PDF_MAX_PAGES if max_pages is None else max_pages
+    max_chars = PDF_MAX_TEXT_CHARS if max_chars is None else max_chars
+
+    # fitz is only used under the lock, and the lock is never held across a
+    # yield: the consumer may advance this generator from different threads
+    with pdf_ocr.fitz_lock:
+        doc = fitz.open(stream=content, filetype="pdf")
+        page_count = len(doc)
+    try:
+        if page_count > max_pages:
+            raise DocumentTooLargeError(f"PDF has {page_count} pages, the limit is {max_pages}.")
+
+        total_chars = 0
+        for window_start in range(0, page_count, pdf_ocr.OCR_WINDOW_PAGES):
+            page_numbers = range(window_start, min(window_start + pdf_ocr.OCR_WINDOW_PAGES, page_count))
+            with pdf_ocr.fitz_lock:
+                texts = {n: doc[n].get_text() or "" for n in page_numbers}
+                scanned = [n for n in page_numbers if pdf_ocr.needs_ocr(doc[n], texts[n])]
+            if scanned:
+                for page_num, (text, _boxes) in pdf_ocr.ocr_layouts(content, doc, scanned).items():
+                    texts[page_num] = text
+
+            for page_num in page_numbers:
+                total_chars += len(texts[page_num])
+                if total_chars > max_chars:
+                    raise DocumentTooLargeError(f"PDF text exceeds the limit of {max_chars} characters.")
+                yield texts[page_num]
+    finally:
+        with pdf_ocr.fitz_lock:
+            doc.close()
+
+class PageSteps:
+    """
+    A page iterator advanced one step at a time from pool threads. close()
+    waits for a step still running (e.g. after the client disconnected)
+    instead of failing with "generator already executing".
+    """
+
+    def __init__(self, pages: Iterator[str]):
+        self.pages = pages
+        self._lock = threading.Lock()
+
+    def next(self) -> Optional[str]:
+        with self._lock:
+            return next(self.pages, None)
+
+    def close(self):
+        with self._lock:
+            close = getattr(self.pages, "close", None)
+            if close:
+                close()
+
 class RedactionService:
-    def __init__(self):
-        self.analyzer = AnalyzerEngine()
-        self.anonymizer = AnonymizerEngine()
+    def __init__(self, preload: bool = True):
+        if preload:
+            # Load the default models now rather than on the first request.
+            # Pool workers skip this and load only the tiers they are asked for.
+            model_registry.get_analyzer()
+            model_registry.get_anonymizer()
         self.openai_key = os.getenv("OPENAI_API_KEY")
-        self.client = OpenAI(api_key=self.openai_key) if self.openai_key else None
-
-    def redact_with_presidio(self, text: str) -> str:
-        results = self.analyzer.analyze(text=text, language='en')
-        
-        # Define the operator to replace with black blocks
-        operators = {
-            "DEFAULT": OperatorConfig("replace", {"new_value": "████████"})
-        }
-        
+        self.llm = LLMRedactor(api_key=self.openai_key) if self.openai_key else None
+        self.result_cache = ResultCache(
+            max_entries=int(os.getenv("REDACTION_CACHE_SIZE", "64")),
+            disk_dir=os.getenv("REDACTION_CACHE_DIR") or None
+        )
+
+    @property
+    def analyzer(self):
+        return model_registry.get_analyzer()
+
+    @property
+    def anonymizer(self):
+        return model_registry.get_anonymizer()
+
+    def supported_entities(self) -> List[str]:
+        return sorted(self.analyzer.get_supported_entities(language="en"))
+
+    def parse_entities(self, value: Optional[str]) -> Optional[List[str]]:
+        """parse_entities, rejecting names no recognizer supports before any redaction runs."""
+        return parse_entities(value, self.supported_entities())
+
+    def result_cache_key(self, content: bytes, filename: str, method: str, entities: Optional[List[str]] = None, tier: Optional[str] = None) -> str:
+        # The extension decides how text is extracted, so it is part of the key
+        ext = os.path.splitext(filename.lower())[1]
+        return make_key(content, ext, method, ",".join(entities or []), redaction_tiers.get_tier(tier).name, ENGINE_VERSION)
+
+    def presidio_method(self, tier: Optional[str] = None) -> str:
+        name = redaction_tiers.get_tier(tier).name
+        return "Presidio (Local)" if name == "accurate" else f"Presidio ({name})"
+
+    def get_analyzer(self, entities: Optional[List[str]] = None, tier: Optional[str] = None):
+        spec = redaction_tiers.get_tier(tier)
+        # Callers asking for a subset of entities or a lighter tier get a cached, pruned registry
+        if entities or spec.model_name != model_registry.DEFAULT_SPACY_MODEL or not spec.ner:
+            return redaction_tiers.get_analyzer(spec, entities)
+        return self.analyzer
+
+    def analyze_text(self, text: str, entities: Optional[List[str]] = None, tier: Optional[str] = None) -> list:
+        spec = redaction_tiers.get_tier(tier)
+        analyzer = self.get_analyzer(entities, spec.name)
+        started = time.perf_counter()
+        # Large documents are split into chunks and analyzed across processes
+        if len(text) >= parallel_analysis.CHUNKED_ANALYSIS_THRESHOLD:
+            results = parallel_analysis.analyze_in_chunks(text, analyzer, entities, spec)
+        else:
+            results = run_analyzer(analyzer, text, entities)
+        redaction_tiers.record(spec, len(text), time.perf_counter() - started)
+        return results
+
+    def anonymize(self, text: str, results: list, style: str = "block") -> str:
+        # "block" replaces every entity with black blocks. Overlaps are resolved
+        # here rather than by the anonymizer, so the spans response format can
+        # reproduce this output from the same ranges.
         anonymized_result = self.anonymizer.anonymize(
             text=text,
-            analyzer_results=results,
-            operators=operators
+            analyzer_results=resolve_results(text, results),
+            operators=REPLACEMENT_STYLES[style]
         )
         return anonymized_result.text
 
-    def redact_with_gpt4(self, text: str) -> str:
-        if not self.client:
-            return self.redact_with_presidio(text)
-            
-        try:
-            response = self.client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "You are an advanced redaction engine. Your task is to redact ALL Personally Identifiable Information (PII) and sensitive data from the text. This includes but is not limited to: Names, Email Addresses, Phone Numbers, Physical Addresses, Dates, Times, Credit Card Numbers, Social Security Numbers, Passport Numbers, Driver's License Numbers, and IP Addresses. Replace each instance of sensitive data with the exact string '████████'. Do not describe what you redacted, just return the text with the redactions applied."},
-                    {"role": "user", "content": text}
-                ],
-                temperature=0
-            )
-            return response.choices[0].message.content
-        except Exception as e:
-            print(f"OpenAI Error: {e}")
-            return self.redact_with_presidio(text) # Fallback
+    def redact_with_presidio(self, text: str, entities: Optional[List[str]] = None, tier: Optional[str] = None) -> str:
+        return self.redact_with_presidio_spans(text, entities, tier)[0]
+
+    def redact_with_presidio_spans(self, text: str, entities: Optional[List[str]] = None, tier: Optional[str] = None) -> Tuple[str, List[list]]:
+        """Redact text and also return the detected spans in their stored form."""
+        results = self.analyze_text(text, entities, tier)
+        return self.anonymize(text, results), encode_spans(results)
+
+    def apply_spans(self, text: str, spans: List[list], entities: Optional[List[str]] = None, score_threshold: float = 0.0, style: str = "block") -> str:
+        """Re-redact text from previously stored spans under a new policy, without any NLP."""
+        if style not in REPLACEMENT_STYLES:
+            raise ValueError(f"Unknown replacement style '{style}'. Use one of: {sorted(REPLACEMENT_STYLES)}")
+        return self.anonymize(text, decode_spans(spans, entities, score_threshold), style)
+
+    async def redact_with_gpt4(self, text: str) -> str:
+        async def presidio_fallback(chunk: str) -> str:
+            return await worker_pools.text.run(self.redact_with_presidio, chunk)
+
+        if not self.llm:
+            return await presidio_fallback(text)
+
+        # Chunks are redacted concurrently; a failed chunk falls back on its own
+        return await self.llm.redact(text, presidio_fallback)
+
+    def cascade_plan(self, text: str) -> Tuple[List[tuple], Optional[List[list]]]:
+        """
+        Run Presidio over the whole text and split it into LLM-sized chunks.
+        Each chunk comes back as (Presidio redaction, LLM input or None); the
+        LLM input is the chunk with its confident findings already blocked out.
+        Also returns the entity spans when no chunk needs the LLM.
+        """
+        results = self.analyze_text(text)
+        plan = []
+        for offset, chunk in llm_redaction.split_for_llm_with_offsets(text):
+            local = self._clip_results(results, offset, offset + len(chunk))
+            # Kept for escalated chunks too, as the fallback if the LLM call fails
+            presidio_text = self.anonymize(chunk, local)
+            llm_input = None
+            if llm_redaction.escalation_reason(local):
+                confident = [r for r in local if r.score >= llm_redaction.CASCADE_ESCALATE_BELOW]
+                llm_input = self.anonymize(chunk, confident)
+            plan.append((presidio_text, llm_input))
+
+        escalated = sum(1 for _, llm_input in plan if llm_input is not None)
+        print(f"DEBUG: Cascade: {escalated} of {len(plan)} chunks escalated to the LLM", flush=True)
+        return plan, (encode_spans(results) if not escalated else None)
+
+    def _clip_results(self, results: list, start: int, end: int) -> List[RecognizerResult]:
+        # Fresh objects in chunk-local offsets
+        return [
+            RecognizerResult(r.entity_type, max(r.start, start) - start, min(r.end, end) - start, r.score)
+            for r in results if r.start < end and r.end > start
+        ]
+
+    async def redact_with_cascade(self, text: str) -> Tuple[str, Optional[List[list]]]:
+        """Presidio first; only uncertain or ambiguous chunks are sent to the LLM."""
+        plan, entity_spans = await worker_pools.text.run(self.cascade_plan, text)
+
+        async def resolve(presidio_text: str, llm_input: Optional[str]) -> str:
+            if llm_input is None:
+                return presidio_text
+
+            async def fallback(_chunk: str) -> str:
+                return presidio_text
+
+            return await self.llm.redact_chunk(llm_input, fallback)
+
+        redacted = await asyncio.gather(*(resolve(presidio_text, llm_input) for presidio_text, llm_input in plan))
+        return "".join(redacted), entity_spans
 
     def extract_text_from_pdf(self, content: bytes) -> str:
         try:
-            pdf_file = io.BytesIO(content)
-            reader = pypdf.PdfReader(pdf_file)
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
-            return text
+            return "".join(page + "\n" for page in iter_pdf_pages(content))
+        except DocumentTooLargeError:
+            raise
         except Exception as e:
             print(f"PDF Extraction Error: {e}")
             return ""
 
-    def extract_pages_from_pdf(self, content: bytes) -> List[str]:
-        try:
-            pdf_file = io.BytesIO(content)
-            reader = pypdf.PdfReader(pdf_file)
-            pages = []
-            for page in reader.pages:
-                text = page.extract_text()
-                if not text:
-                    text = "" # Ensure we have a string even if empty
-                pages.append(text)
-            return pages
-        except Exception as e:
-            print(f"PDF Page Extraction Error: {e}")
-            return []
-
     def extract_text_from_docx(self, content: bytes) -> str:
         try:
-            docx_file = io.BytesIO(content)
-            doc = docx.Document(docx_file)
-            text = ""
-            for para in doc.paragraphs:
-                text += para.text + "\n"
-            return text
+            # Streams the package XML; also picks up tables, text boxes, headers and footers
+            return "".join(block.text + "\n" for block in iter_docx_blocks(content))
         except Exception as e:
             print(f"DOCX Extraction Error: {e}")
             return ""
 
-    async def process_file(self, file: UploadFile) -> dict:
+    def extract_text(self, content: bytes, filename: str) -> str:
+        filename = filename.lower()
+        if filename.endswith('.pdf'):
+            return self.extract_text_from_pdf(content)
+        elif filename.endswith('.docx'):
+            return self.extract_text_from_docx(content)
+        # Default to text
+        return content.decode('utf-8')
+
+    async def process_file(self, file: UploadFile, entities: Optional[List[str]] = None, tier: Optional[str] = None) -> dict:
         content = await file.read()
         filename = file.filename.lower()
-        text_content = ""
-        
+        spec = redaction_tiers.get_tier(tier)
+
+        # Use GPT-4 if key is available, otherwise fallback to Presidio.
+        # An explicit entity selection or a faster tier always goes to Presidio.
+        use_gpt4 = bool(self.openai_key and self.openai_key != "your_api_key_here") and not entities and spec.name == "accurate"
+        use_cascade = use_gpt4 and llm_redaction.LLM_REDACTION_MODE == "cascade"
+        if use_gpt4:
+            method = "Presidio + GPT-4 (cascade)" if use_cascade else "GPT-4"
+        else:
+            method = self.presidio_method(spec.name)
+
+        # Re-uploads of the same file skip extraction and analysis entirely
+        cache_key = self.result_cache_key(content, filename, method, entities, spec.name)
+        cached = self.result_cache.get(cache_key)
+        if cached is not None:
+            print(f"DEBUG: Result cache hit for {file.filename}")
+            return {**cached, "original_filename": file.filename, "cached": True}
+
+        # Text pool slots are held only around CPU-bound steps, never while
+        # waiting on the LLM, so slow API calls can't fill the pool's queue
         try:
-            if filename.endswith('.pdf'):
-                text_content = self.extract_text_from_pdf(content)
-            elif filename.endswith('.docx'):
-                text_content = self.extract_text_from_docx(content)
-            else:
-                # Default to text
-                text_content = content.decode('utf-8')
-            
+            # Extraction and analysis are CPU-bound; keep them off the event loop
+            text_content = await worker_pools.text.run(self.extract_text, content, filename)
+
             if not text_content.strip():
                 return {
                     "original_filename": file.filename,
@@ -113,21 +305,20 @@ class RedactionService:
                     "status": "error"
                 }
 
-            # Use GPT-4 if key is available, otherwise fallback to Presidio
-            if self.openai_key and self.openai_key != "your_api_key_here":
-                redacted_text = self.redact_with_gpt4(text_content)
-                method = "GPT-4"
+            # The LLM rewrites text rather than reporting spans, so only Presidio stores them
+            entity_spans = None
+            if use_cascade:
+                # Spans come back only when Presidio handled every chunk on its own
+                redacted_text, entity_spans = await self.redact_with_cascade(text_content)
+            elif use_gpt4:
+                # Network-bound, so it stays on the event loop
+                redacted_text = await self.redact_with_gpt4(text_content)
             else:
-                redacted_text = self.redact_with_presidio(text_content)
-                method = "Presidio (Local)"
-
-            return {
-                "original_filename": file.filename,
-                "original_content": text_content,
-                "redacted_content": redacted_text,
-                "method": method,
-                "status": "success"
-            }
+                redacted_text, entity_spans = await worker_pools.text.run(
+                    self.redact_with_presidio_spans, text_content, entities, spec.name
+                )
+        except PoolSaturatedError:
+            raise
         except Exception as e:
             return {
                 "original_filename": file.filename,
@@ -135,50 +326,227 @@ class RedactionService:
                 "status": "error"
             }
 
-    def redact_pdf_file(self, content: bytes) -> bytes:
+        result = {
+            "original_filename": file.filename,
+            "original_content": text_content,
+            "redacted_content": redacted_text,
+            "entity_spans": entity_spans,
+            "method": method,
+            "tier": spec.name,
+            "status": "success"
+        }
+        self.result_cache.put(cache_key, result)
+        return result
+
+    async def stream_file(self, content: bytes, filename: str, entities: Optional[List[str]] = None, tier: Optional[str] = None) -> AsyncIterator[dict]:
+        """
+        Redact a document page by page with Presidio, yielding a record as soon
+        as each page is done. PDFs are read lazily a page at a time; other formats
+        are extracted first and split into pieces of STREAM_TEXT_CHUNK_CHARS.
+        Records: one "start", one "page" per page, then "done" (with the
+        assembled text and spans) or "error".
         """
-        Redacts a PDF file by drawing black rectangles over sensitive text.
+        spec = redaction_tiers.get_tier(tier)
+        is_pdf = filename.lower().endswith('.pdf')
+
+        # Slots are taken per step below, so a slow client doesn't hold one
+        # while it reads; this check only lets a busy pool answer with a 503
+        # before the stream starts
+        with worker_pools.text.slot():
+            pass
+        yield {"type": "start", "filename": filename, "method": self.presidio_method(spec.name), "tier": spec.name}
+
+        original_parts = []
+        redacted_parts = []
+        entity_spans = []
+        offset = 0
+        page_num = 0
+        pages = None
+        # Everything after "start" is inside the try: the response status is
+        # already sent, so failures must arrive as an "error" record
+        try:
+            if is_pdf:
+                pages = PageSteps(iter_pdf_pages(content))
+            else:
+                text_content = await worker_pools.text.run(self.extract_text, content, filename)
+                pages = PageSteps(iter(chunk for _, chunk in parallel_analysis.split_text(text_content, STREAM_TEXT_CHUNK_CHARS, 0)))
+
+            while True:
+                # Each step of the page iterator extracts (and, if needed, OCRs) the next page
+                page_text = await worker_pools.text.run(pages.next)
+                if page_text is None:
+                    break
+                redacted_text, spans = await worker_pools.text.run(
+                    self.redact_with_presidio_spans, page_text, entities, spec.name
+                )
+                yield {
+                    "type": "page",
+                    "page": page_num,
+                    "original_content": page_text,
+                    "redacted_content": redacted_text,
+                    "entities": len(spans),
+                }
+
+                # PDF pages are joined with newlines, the same as extract_text_from_pdf
+                separator = "\n" if is_pdf else ""
+                original_parts.append(page_text + separator)
+                redacted_parts.append(redacted_text + separator)
+                entity_spans.extend([t, s + offset, e + offset, score] for t, s, e, score in spans)
+                offset += len(page_text) + len(separator)
+                page_num += 1
+        except Exception as e:
+            yield {"type": "error", "page": page_num, "message": f"Error processing file: {str(e)}", "status": "error"}
+            return
+        finally:
+            if pages is not None:
+                # Off the event loop, and after a step a disconnect left running
+                worker_pools.text.executor.submit(pages.close)
+
+        original_content = "".join(original_parts)
+        if not original_content.strip():
+            yield {"type": "error", "message": "Could not extract text from file.", "status": "error"}
+            return
+
+        yield {
+            "type": "done",
+            "pages": page_num,
+            "original_content": original_content,
+            "redacted_content": "".join(redacted_parts),
+            "entity_spans": entity_spans,
+            "status": "success",
+        }
+
+    def page_layout(self, page) -> Tuple[str, List[Optional[tuple]]]:
+        """Text and per-character boxes of a page's own text layer."""
+        return pdf_ocr.rawdict_layout(page.get_text("rawdict", flags=pdf_ocr.RAWDICT_FLAGS))
+
+    def span_rects(self, boxes: List[Optional[tuple]], start: int, end: int) -> List[fitz.Rect]:
+        """One rectangle per line fragment covered by the [start, end) character span."""
+        rects = []
+        current = None
+        for bbox in boxes[start:end]:
+            if bbox is None:
+                if current is not None:
+                    rects.append(current)
+                current = None
+                continue
+            if current is None:
+                current = fitz.Rect(bbox)
+            else:
+                current |= bbox
+        if current is not None:
+            rects.append(current)
+        return rects
+
+    def redact_pdf_page(self, page, analyzer, entities: Optional[List[str]] = None, layout=None) -> int:
+        """
+        Detect PII on one page and remove it with a single redaction pass.
+        Returns the number of entities found. The fitz lock is taken to read
+        the page and to apply the redactions, not while the analyzer runs.
+        """
+        if layout is None:
+            with pdf_ocr.fitz_lock:
+                layout = self.page_layout(page)
+        text, boxes = layout
+        if not text.strip():
+            return 0
+
+        # Analyze text to find PII
+        results = run_analyzer(analyzer, text, entities)
+        if not results:
+            return 0
+
+        rects = [rect for result in results for rect in self.span_rects(boxes, result.start, result.end)]
+        with pdf_ocr.fitz_lock:
+            for rect in rects:
+                page.add_redact_annot(rect, fill=(0, 0, 0))
+            # Removes the covered text (not just paints over it), once per page.
+            # Image pixels under the boxes are blanked too, which is what hides
+            # PII on scanned pages where the text only exists in the image.
+            page.apply_redactions(images=fitz.PDF_REDACT_IMAGE_PIXELS)
+        return len(results)
+
+    def redact_docx_file(self, content: bytes, entities: Optional[List[str]] = None, tier: Optional[str] = None) -> bytes:
+        """
+        Redacts a DOCX in place, rewriting only the runs that contain PII, plus
+        comments, tracked deletions, field codes and hyperlink targets; authors
+        and document properties are blanked. Formatting and every untouched
+        part of the package are kept as-is.
+        """
+        tier = redaction_tiers.get_tier(tier).name
+        # "/2": entries cached before comments and metadata were redacted still hold them
+        cache_key = make_key(content, ".docx", "DOCX in place/2", ",".join(entities or []), tier, ENGINE_VERSION)
+        cached = self.result_cache.get(cache_key)
+        if cached is not None:
+            print("DEBUG: Result cache hit for redacted DOCX")
+            return cached
+
+        result_bytes = redact_docx_package(content, lambda text: self.analyze_text(text, entities=entities, tier=tier))
+        self.result_cache.put(cache_key, result_bytes)
+        return result_bytes
+
+    def redact_pdf_file(self, content: bytes, entities: Optional[List[str]] = None, tier: Optional[str] = None) -> bytes:
+        """
+        Redacts a PDF file by removing sensitive text under black boxes.
         Preserves the original layout.
         """
         print(f"DEBUG: Starting redact_pdf_file. Content size: {len(content)} bytes")
+        tier = redaction_tiers.get_tier(tier).name
+        cache_key = make_key(content, ".pdf", "PyMuPDF layout", ",".join(entities or []), tier, ENGINE_VERSION)
+        cached = self.result_cache.get(cache_key)
+        if cached is not None:
+            print("DEBUG: Result cache hit for redacted PDF")
+            return cached
+
+        analyzer = self.get_analyzer(entities, tier)
+
+        doc = None
         try:
-            doc = fitz.open(stream=content, filetype="pdf")
-            print(f"DEBUG: Opened PDF. Pages: {len(doc)}")
-            
-            for page_num, page in enumerate(doc):
-                text = page.get_text()
-                if not text:
-                    print(f"DEBUG: Page {page_num} has no text.")
-                    continue
-                
-                # Analyze text to find PII
-                results = self.analyzer.analyze(text=text, language='en')
-                print(f"DEBUG: Page {page_num}: Found {len(results)} PII entities.")
-                
-                # For each result, find the bounding box and draw a rectangle
-                for result in results:
-                    # Get the sensitive text snippet
-                    sensitive_text = text[result.start:result.end]
-                    
-                    # Search for this text on the page to get coordinates
-                    # We use page.search_for which returns a list of Rect objects
-                    areas = page.search_for(sensitive_text)
-                    
-                    for area in areas:
-                        # Draw a black rectangle over the area
-                        page.draw_rect(area, color=(0, 0, 0), fill=(0, 0, 0))
-            
-            # Save the modified PDF to bytes
-            output_buffer = io.BytesIO()
-            doc.save(output_buffer)
+            # PyMuPDF isn't thread-safe; the lock is released while waiting on the process pool
+            with pdf_ocr.fitz_lock:
+                doc = fitz.open(stream=content, filetype="pdf")
+                page_count = len(doc)
+            print(f"DEBUG: Opened PDF. Pages: {page_count}")
+
+            # Large documents are redacted in page ranges on separate processes
+            if parallel_analysis.should_parallelize_pdf(page_count):
+                result_bytes = parallel_analysis.redact_pdf_in_parallel(doc, entities, tier)
+                if result_bytes is not None:
+                    print(f"DEBUG: Finished redact_pdf_file. Result size: {len(result_bytes)} bytes")
+                    self.result_cache.put(cache_key, result_bytes)
+                    return result_bytes
+
+            # Scanned pages get their layout from OCR, run in parallel up front
+            with pdf_ocr.fitz_lock:
+                scanned = [n for n, page in enumerate(doc) if pdf_ocr.needs_ocr(page)]
+            ocr = pdf_ocr.ocr_layouts(content, doc, scanned) if scanned else {}
+
+            # redact_pdf_page only holds the lock around fitz calls, so other
+            # requests' PDF work isn't stuck behind this document's NER
+            page = None
+            for page_num in range(page_count):
+                with pdf_ocr.fitz_lock:
+                    page = doc[page_num]
+                found = self.redact_pdf_page(page, analyzer, entities, layout=ocr.get(page_num))
+                print(f"DEBUG: Page {page_num}: Found {found} PII entities.")
+
+            with pdf_ocr.fitz_lock:
+                page = None
+                # Save the modified PDF to bytes
+                output_buffer = io.BytesIO()
+                doc.save(output_buffer)
             result_bytes = output_buffer.getvalue()
             print(f"DEBUG: Finished redact_pdf_file. Result size: {len(result_bytes)} bytes")
+            self.result_cache.put(cache_key, result_bytes)
             return result_bytes
             
         except Exception as e:
             print(f"PyMuPDF Redaction Error: {e}")
             import traceback
             traceback.print_exc()
-            # Return original content if redaction fails (or handle error appropriately)
-            # For safety, maybe return empty bytes or raise error
-            return content
+            # Never hand back the original as if it were redacted
+            raise
+        finally:
+            if doc is not None:
+                with pdf_ocr.fitz_lock:
+                    doc.close()
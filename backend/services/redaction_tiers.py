@@ -0,0 +1,72 @@
+import os
+import threading
+from typing import Dict, List, NamedTuple, Optional
+from services import model_registry
+
+
+class Tier(NamedTuple):
+    """A speed/accuracy trade-off for text redaction."""
+    name: str
+    model_name: str  # spaCy pipeline the analyzer runs on (see model_registry.SPACY_PIPELINES)
+    ner: bool        # False keeps only pattern, checksum and context recognizers
+    description: str
+
+
+TIERS: Dict[str, Tier] = {
+    "fast": Tier(
+        "fast", "en_core_web_sm-ner", False,
+        "Regex, checksum and pattern recognizers only (emails, phones, cards, IDs); no NER."
+    ),
+    "balanced": Tier(
+        "balanced", "en_core_web_sm-ner", True,
+        "Small spaCy model with the parser disabled; finds names and places at lower accuracy."
+    ),
+    "accurate": Tier(
+        "accurate", model_registry.DEFAULT_SPACY_MODEL, True,
+        "Large spaCy model with every Presidio recognizer."
+    ),
+}
+
+DEFAULT_TIER = os.getenv("REDACTION_DEFAULT_TIER", "accurate")
+
+_throughput: Dict[str, Dict] = {name: {"documents": 0, "chars": 0, "seconds": 0.0} for name in TIERS}
+_throughput_lock = threading.Lock()
+
+
+def get_tier(name: Optional[str] = None) -> Tier:
+    name = (name or DEFAULT_TIER).strip().lower()
+    if name not in TIERS:
+        raise ValueError(f"Unknown tier '{name}'. Use one of: {list(TIERS)}")
+    return TIERS[name]
+
+
+def get_analyzer(tier: Tier, entities: Optional[List[str]] = None):
+    return model_registry.get_analyzer(tier.model_name, entities=entities, ner=tier.ner)
+
+
+def record(tier: Tier, chars: int, seconds: float):
+    """Count one analyzed text toward the tier's measured throughput."""
+    with _throughput_lock:
+        stats = _throughput[tier.name]
+        stats["documents"] += 1
+        stats["chars"] += chars
+        stats["seconds"] += seconds
+
+
+def tier_report() -> List[Dict]:
+    """Each tier with the throughput measured in this process so far."""
+    report = []
+    with _throughput_lock:
+        for tier in TIERS.values():
+            stats = _throughput[tier.name]
+            report.append({
+                "name": tier.name,
+                "description": tier.description,
+                "model": tier.model_name,
+                "ner": tier.ner,
+                "default": tier.name == DEFAULT_TIER,
+                "documents": stats["documents"],
+                "chars": stats["chars"],
+                "chars_per_second": round(stats["chars"] / stats["seconds"]) if stats["seconds"] else None,
+            })
+    return report
@@ -0,0 +1,97 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional, Union
+
+CacheValue = Union[dict, bytes]
+
+
+def make_key(content: bytes, *parts: str) -> str:
+    """Content-addressed key: hash of the file bytes plus everything that changes the output."""
+    digest = hashlib.sha256(content)
+    for part in parts:
+        digest.update(b"\0")
+        digest.update(str(part).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Two-tier cache for redaction results: a bounded in-memory LRU and an
+    optional on-disk tier that survives restarts. Values are JSON-serializable
+    dicts or raw bytes.
+    """
+
+    def __init__(self, max_entries: int = 64, disk_dir: Optional[str] = None):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self._entries: "OrderedDict[str, CacheValue]" = OrderedDict()
+        self._lock = threading.Lock()
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    def get(self, key: str) -> Optional[CacheValue]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                return value
+
+        value = self._read_disk(key)
+        if value is not None:
+            self._remember(key, value)
+        return value
+
+    def put(self, key: str, value: CacheValue):
+        self._remember(key, value)
+        self._write_disk(key, value)
+
+    def _remember(self, key: str, value: CacheValue):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _disk_path(self, key: str, ext: str) -> str:
+        # Fan out by prefix so one directory doesn't collect every entry
+        return os.path.join(self.disk_dir, key[:2], f"{key}{ext}")
+
+    def _read_disk(self, key: str) -> Optional[CacheValue]:
+        if not self.disk_dir:
+            return None
+        try:
+            json_path = self._disk_path(key, ".json")
+            if os.path.exists(json_path):
+                with open(json_path, "r", encoding="utf-8") as f:
+                    return json.load(f)
+            bin_path = self._disk_path(key, ".bin")
+            if os.path.exists(bin_path):
+                with open(bin_path, "rb") as f:
+                    return f.read()
+        except Exception as e:
+            print(f"Result cache read error for {key}: {e}")
+        return None
+
+    def _write_disk(self, key: str, value: CacheValue):
+        if not self.disk_dir:
+            return
+        try:
+            is_bytes = isinstance(value, (bytes, bytearray))
+            path = self._disk_path(key, ".bin" if is_bytes else ".json")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temp file and rename so readers never see a partial entry
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            if is_bytes:
+                with open(tmp_path, "wb") as f:
+                    f.write(value)
+            else:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(value, f)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"Result cache write error for {key}: {e}")
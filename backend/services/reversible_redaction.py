@@ -1,11 +1,13 @@
 import os
 import shutil
-from typing import Optional, Dict
+from typing import Optional, Dict, List
 from fastapi import UploadFile
 from passlib.context import CryptContext
 import database
 import uuid
 from services.redaction import RedactionService
+from services import redaction_tiers, worker_pools
+from services.worker_pools import PoolSaturatedError
 from reportlab.lib.pagesizes import letter
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
@@ -31,12 +33,13 @@ except Exception as e:
     pwd_context = None
 
 class ReversibleRedactionService:
-    def __init__(self):
+    def __init__(self, redaction_service: Optional[RedactionService] = None):
         self.upload_dir = "uploads"
         self.output_dir = "outputs"
         os.makedirs(self.upload_dir, exist_ok=True)
         os.makedirs(self.output_dir, exist_ok=True)
-        self.redaction_service = RedactionService()
+        # Share the caller's service (and its models) when one is provided
+        self.redaction_service = redaction_service or RedactionService()
 
     def verify_password(self, plain_password, hashed_password):
         if not pwd_context:
@@ -48,7 +51,7 @@ class ReversibleRedactionService:
             raise RuntimeError("Password hashing not initialized. Check server logs for missing dependencies (passlib, argon2-cffi).")
         return pwd_context.hash(password)
 
-    async def process_upload(self, file: UploadFile, password: str, user_id: str) -> Dict:
+    async def process_upload(self, file: UploadFile, password: str, user_id: str, entities: Optional[List[str]] = None, output_format: str = "pdf", tier: Optional[str] = None) -> Dict:
         try:
             print(f"DEBUG: Processing upload for user {user_id}")
             print(f"DEBUG: Password type: {type(password)}")
@@ -74,7 +77,10 @@ class ReversibleRedactionService:
             # 2. Create "redacted" version
             # unique_filename already has extension, so we strip it for the redacted filename base
             base_name = os.path.splitext(unique_filename)[0]
-            redacted_filename = f"redacted_{base_name}.pdf" 
+            # DOCX can be redacted in place instead of re-typeset as a PDF
+            docx_in_place = filename.lower().endswith('.docx') and output_format == "docx"
+            redacted_ext = ".docx" if docx_in_place else ".pdf"
+            redacted_filename = f"redacted_{base_name}{redacted_ext}"
             redacted_path = os.path.join(self.output_dir, redacted_filename)
             
             # Reset file pointer before reading
@@ -82,57 +88,11 @@ class ReversibleRedactionService:
             # Extract content
             content = await file.read()
             
-            if filename.lower().endswith('.pdf'):
-                # Use PyMuPDF to redact directly on the PDF
-                redacted_bytes = self.redaction_service.redact_pdf_file(content)
-                with open(redacted_path, "wb") as f:
-                    f.write(redacted_bytes)
-            else:
-                # Fallback for non-PDFs (DOCX, etc) - Convert to text and create simple PDF
-                # (Keeping existing logic for non-PDFs or improving it slightly)
-                text_content = ""
-                if filename.lower().endswith('.docx'):
-                    text_content = self.redaction_service.extract_text_from_docx(content)
-                else:
-                    text_content = content.decode('utf-8', errors='ignore')
-
-                # Redact text
-                redacted_text = self.redaction_service.redact_with_presidio(text_content)
-                
-                # Generate simple PDF
-                try:
-                    doc = SimpleDocTemplate(
-                        redacted_path,
-                        pagesize=letter,
-                        rightMargin=72, leftMargin=72,
-                        topMargin=72, bottomMargin=18
-                    )
-                    styles = getSampleStyleSheet()
-                    flowables = []
-                    flowables.append(Paragraph(f"Redacted Version: {filename}", styles["Heading1"]))
-                    flowables.append(Spacer(1, 12))
-                    
-                    # Create a custom style with the registered font
-                    body_style = ParagraphStyle(
-                        'CustomBody',
-                        parent=styles['BodyText'],
-                        fontName=FONT_NAME,
-                        fontSize=10,
-                        leading=12
-                    )
-
-                    for paragraph in redacted_text.split('\n'):
-                        if paragraph.strip():
-                            flowables.append(Paragraph(paragraph, body_style))
-                            flowables.append(Spacer(1, 6))
-                    
-                    doc.build(flowables)
-                except Exception as e:
-                    print(f"Error generating PDF from text: {e}")
-                    shutil.copy(original_path, redacted_path)
+            # Redaction (and the PDF render) is CPU-bound; run it on the text pool
+            await worker_pools.text.run(self._write_redacted_version, content, filename, original_path, redacted_path, entities, docx_in_place, tier)
 
             # 3. Hash password
-            hashed_password = self.get_password_hash(password)
+            hashed_password = await worker_pools.hashing.run(self.get_password_hash, password)
 
             # Generate URLs (assuming localhost for now, should be env var)
             base_url = os.getenv("API_BASE_URL", "http://localhost:8000")
@@ -158,17 +118,95 @@ class ReversibleRedactionService:
             else:
                 return {"status": "error", "message": "Database save failed"}
 
+        except PoolSaturatedError:
+            raise
         except Exception as e:
             print(f"Error in reversible upload: {e}")
             return {"status": "error", "message": str(e)}
 
+    def _write_redacted_version(self, content: bytes, filename: str, original_path: str, redacted_path: str, entities: Optional[List[str]] = None, docx_in_place: bool = False, tier: Optional[str] = None):
+        if filename.lower().endswith('.pdf'):
+            # Use PyMuPDF to redact directly on the PDF
+            redacted_bytes = self.redaction_service.redact_pdf_file(content, entities, tier)
+            with open(redacted_path, "wb") as f:
+                f.write(redacted_bytes)
+        elif docx_in_place:
+            # Rewrite only the affected runs inside the original package; no reportlab render
+            redacted_bytes = self.redaction_service.redact_docx_file(content, entities, tier)
+            with open(redacted_path, "wb") as f:
+                f.write(redacted_bytes)
+        else:
+            # Fallback for non-PDFs (DOCX, etc) - Convert to text and create simple PDF
+            # (Keeping existing logic for non-PDFs or improving it slightly)
+            # Shares cache entries with /upload's Presidio path
+            method = self.redaction_service.presidio_method(tier)
+            cache = self.redaction_service.result_cache
+            cache_key = self.redaction_service.result_cache_key(content, filename, method, entities, tier)
+            cached = cache.get(cache_key)
+            if cached is not None:
+                redacted_text = cached["redacted_content"]
+            else:
+                # Only text extracted exactly as /upload would may go in the shared entry
+                try:
+                    text_content = self.redaction_service.extract_text(content, filename)
+                    shareable = True
+                except UnicodeDecodeError:
+                    text_content = content.decode('utf-8', errors='ignore')
+                    shareable = False
+
+                # Redact text
+                redacted_text, entity_spans = self.redaction_service.redact_with_presidio_spans(text_content, entities=entities, tier=tier)
+                if shareable and text_content.strip():
+                    # Same shape as process_file's result, so an /upload hit can store and index it
+                    cache.put(cache_key, {
+                        "original_filename": filename,
+                        "original_content": text_content,
+                        "redacted_content": redacted_text,
+                        "entity_spans": entity_spans,
+                        "method": method,
+                        "tier": redaction_tiers.get_tier(tier).name,
+                        "status": "success"
+                    })
+
+            # Generate simple PDF
+            try:
+                doc = SimpleDocTemplate(
+                    redacted_path,
+                    pagesize=letter,
+                    rightMargin=72, leftMargin=72,
+                    topMargin=72, bottomMargin=18
+                )
+                styles = getSampleStyleSheet()
+                flowables = []
+                flowables.append(Paragraph(f"Redacted Version: {filename}", styles["Heading1"]))
+                flowables.append(Spacer(1, 12))
+
+                # Create a custom style with the registered font
+                body_style = ParagraphStyle(
+                    'CustomBody',
+                    parent=styles['BodyText'],
+                    fontName=FONT_NAME,
+                    fontSize=10,
+                    leading=12
+                )
+
+                for paragraph in redacted_text.split('\n'):
+                    if paragraph.strip():
+                        flowables.append(Paragraph(paragraph, body_style))
+                        flowables.append(Spacer(1, 6))
+
+                doc.build(flowables)
+            except Exception as e:
+                print(f"Error generating PDF from text: {e}")
+                shutil.copy(original_path, redacted_path)
+
     async def unlock_document(self, doc_id: str, password: str) -> Dict:
         try:
             doc = database.get_reversible_doc(doc_id)
             if not doc:
                 return {"status": "error", "message": "Document not found"}
 
-            if self.verify_password(password, doc["password_hash"]):
+            if await worker_pools.hashing.run(self.verify_password, password, doc["password_hash"]):
                 return {
                     "status": "success",
                     "original_url": doc["original_file_path"]
@@ -176,6 +214,8 @@ class ReversibleRedactionService:
             else:
                 return {"status": "error", "message": "Invalid password"}
 
+        except PoolSaturatedError:
+            raise
         except Exception as e:
             print(f"Error unlocking document: {e}")
             return {"status": "error", "message": str(e)}
@@ -1,8 +1,14 @@
 import os
 import re
-import spacy
+import json
+import time
+import hashlib
+import itertools
+import threading
+from collections import OrderedDict
 from supabase import create_client, Client
-from typing import List, Dict, Optional
+from typing import Iterable, Iterator, List, Dict, Optional, Tuple
+from services import model_registry
 
 # Initialize Supabase Client
 url: str = os.environ.get("SUPABASE_URL", "")
@@ -16,29 +22,73 @@ if url and key:
     except Exception as e:
         print(f"Failed to initialize Supabase client: {e}")
 
-# Load SpaCy model (ensure 'en_core_web_lg' or 'en_core_web_sm' is installed)
-try:
-    nlp = spacy.load("en_core_web_lg")
-except OSError:
-    print("Downloading en_core_web_lg...")
-    from spacy.cli import download
-    download("en_core_web_lg")
-    nlp = spacy.load("en_core_web_lg")
+# Seconds a user's rules are served from memory before Supabase is asked again.
+# Saving rules through the app also invalidates them (POST /rules/invalidate).
+RULES_CACHE_TTL = float(os.getenv("RULES_CACHE_TTL", "60"))
 
-def get_user_rules(user_id: str) -> Dict:
+_rules_cache: Dict[str, Tuple[float, Dict]] = {}
+_rules_lock = threading.Lock()
+
+# Texts per nlp.pipe batch when cleaning datasets
+DATASET_NLP_BATCH_SIZE = int(os.getenv("DATASET_NLP_BATCH_SIZE", "256"))
+
+# Compiled blocklist matchers, keyed by rules version
+BLOCKLIST_CACHE_SIZE = int(os.getenv("BLOCKLIST_CACHE_SIZE", "256"))
+_blocklist_matchers: "OrderedDict[str, Optional[re.Pattern]]" = OrderedDict()
+
+def rules_version(rules: Dict) -> str:
+    """Stamp that changes whenever the rules' content changes."""
+    content = json.dumps(
+        {"blocklist": rules.get("blocklist") or [], "pii_categories": rules.get("pii_categories") or {}},
+        sort_keys=True
+    )
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
+
+def get_user_rules(user_id: str, max_age: Optional[float] = None) -> Dict:
+    """
+    Redaction rules for a user, from memory when fetched within the last
+    `max_age` seconds (RULES_CACHE_TTL by default). Pass max_age=0 to force a
+    fresh fetch. The result carries a "version" stamp of its content.
+    """
+    max_age = RULES_CACHE_TTL if max_age is None else max_age
+    with _rules_lock:
+        cached = _rules_cache.get(user_id)
+    if cached is not None and time.monotonic() - cached[0] < max_age:
+        return cached[1]
+
+    rules, cacheable = _fetch_user_rules(user_id)
+    rules = {**rules, "version": rules_version(rules)}
+    # Failed fetches fall back to defaults without caching them, so the next call retries
+    if cacheable:
+        with _rules_lock:
+            _rules_cache[user_id] = (time.monotonic(), rules)
+    return rules
+
+def invalidate_user_rules(user_id: Optional[str] = None):
+    """Drop cached rules for one user, or for everyone when user_id is None."""
+    with _rules_lock:
+        if user_id is None:
+            _rules_cache.clear()
+        else:
+            _rules_cache.pop(user_id, None)
+
+def _fetch_user_rules(user_id: str) -> Tuple[Dict, bool]:
     """
     Fetch redaction rules for a specific user from Supabase.
+    Returns the rules and whether they may be cached.
     """
     if not supabase:
         print("Supabase client not initialized.")
-        return {"blocklist": [], "pii_categories": {}}
+        return {"blocklist": [], "pii_categories": {}}, True
 
     try:
         response = supabase.table("redaction_rules").select("*").eq("user_id", user_id).execute()
         if response.data:
-            return response.data[0]
+            return response.data[0], True
+        cacheable = True
     except Exception as e:
         print(f"Error fetching rules for user {user_id}: {e}")
+        cacheable = False
     
     # Default rules if fetch fails or no rules found
     return {
@@ -50,61 +100,192 @@ def get_user_rules(user_id: str) -> Dict:
             "dates": True,
             "credit_cards": True
         }
-    }
+    }, cacheable
 
-def redact_text_selectively(text: str, user_id: str) -> str:
+def _trie_pattern(words: List[str]) -> str:
     """
-    Redact text based on user-specific rules (PII toggles and blocklist).
+    Regex source matching any of `words`, factored into a prefix tree so the
+    engine follows one branch per character instead of trying every word.
+    Where a word is a prefix of another, the longer one is tried first.
     """
-    rules = get_user_rules(user_id)
-    blocklist = rules.get("blocklist", [])
-    pii_categories = rules.get("pii_categories", {})
+    trie: Dict = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
 
-    # 1. Apply Blocklist Redaction (Regex)
-    for word in blocklist:
-        if word:
-            # Case-insensitive replacement
-            pattern = re.compile(re.escape(word), re.IGNORECASE)
-            text = pattern.sub("[REDACTED]", text)
+    # Built bottom-up with an explicit stack: recursing once per character
+    # would hit the recursion limit on a single long term
+    built: Dict[int, str] = {}
+    stack = [(trie, False)]
+    while stack:
+        node, children_built = stack.pop()
+        if not children_built:
+            stack.append((node, True))
+            stack.extend((child, False) for char, child in node.items() if char)
+            continue
+        terminal = "" in node
+        branches = [re.escape(char) + built.pop(id(child)) for char, child in sorted(node.items()) if char]
+        if not branches:
+            built[id(node)] = ""
+            continue
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # Greedy optional: the longer word wins, the shorter one is the fallback
+        built[id(node)] = "(?:" + body + ")?" if terminal else body
 
-    # 2. Apply SpaCy PII Redaction
-    doc = nlp(text)
-    redacted_text_list = list(text)
-    
+    return built[id(trie)]
+
+def compile_blocklist(blocklist: List[str]) -> Optional[re.Pattern]:
+    """
+    One case-insensitive matcher for a whole blocklist. Matches are reported at
+    every position (the pattern is a lookahead with the word captured), so
+    overlapping terms are all found, as with one search per word.
+    """
+    words = sorted({word.lower() for word in blocklist if word})
+    if not words:
+        return None
+    try:
+        return re.compile("(?=(" + _trie_pattern(words) + "))", re.IGNORECASE)
+    except RecursionError:
+        # Hundreds of words each a prefix of the next nest too deep for the re
+        # compiler; a flat alternation, longest first, matches the same
+        alternation = "|".join(re.escape(word) for word in sorted(words, key=len, reverse=True))
+        return re.compile("(?=(" + alternation + "))", re.IGNORECASE)
+
+def get_blocklist_matcher(rules: Dict) -> Optional[re.Pattern]:
+    """Compiled matcher for a rule set, built once per rules version."""
+    version = rules.get("version") or rules_version(rules)
+    with _rules_lock:
+        if version in _blocklist_matchers:
+            _blocklist_matchers.move_to_end(version)
+            return _blocklist_matchers[version]
+
+    matcher = compile_blocklist(rules.get("blocklist") or [])
+    with _rules_lock:
+        _blocklist_matchers[version] = matcher
+        while len(_blocklist_matchers) > BLOCKLIST_CACHE_SIZE:
+            _blocklist_matchers.popitem(last=False)
+    return matcher
+
+def _entity_labels(pii_categories: Dict) -> List[str]:
     # Map categories to SpaCy labels
     # PERSON, ORG, GPE, DATE, TIME, MONEY, PERCENT, FAC, LOC, PRODUCT, EVENT, WORK_OF_ART, LAW, LANGUAGE, NORP, ORDINAL, CARDINAL
-    labels_to_redact = []
-    
+    labels = []
     if pii_categories.get("names"):
-        labels_to_redact.append("PERSON")
+        labels.append("PERSON")
     if pii_categories.get("dates"):
-        labels_to_redact.append("DATE")
+        labels.append("DATE")
+    return labels
+
+def _ner_only_disabled(nlp) -> List[str]:
+    """
+    Pipeline components that can be skipped when only doc.ents is read: all but
+    the entity recognizer and any shared tok2vec it listens to.
+    """
+    keep = {"ner", "entity_ruler"}
+    for name, pipe in nlp.pipeline:
+        if "ner" in getattr(pipe, "listening_components", []):
+            keep.add(name)
+    return [name for name in nlp.pipe_names if name not in keep]
+
+def _apply_spans(text: str, spans: List[Tuple[int, int, str]]) -> str:
+    """
+    Replace (start, end, replacement) spans in one pass. Overlapping spans are
+    merged and keep the replacement of whichever was listed first.
+    """
+    if not spans:
+        return text
+
+    # Stable sort keeps list order (blocklist, entities, regexes) among equal starts
+    ordered = sorted(enumerate(spans), key=lambda item: (item[1][0], item[0]))
+    merged = []
+    for _, (start, end, replacement) in ordered:
+        if merged and start < merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+            continue
+        merged.append([start, end, replacement])
+
+    parts = []
+    pos = 0
+    for start, end, replacement in merged:
+        parts.append(text[pos:start])
+        parts.append(replacement)
+        pos = end
+    parts.append(text[pos:])
+    return "".join(parts)
+
+def redact_text_selectively(text: str, user_id: str, doc=None, rules: Optional[Dict] = None) -> str:
+    """
+    Redact text based on user-specific rules (PII toggles and blocklist).
+    Pass `doc` (a spaCy Doc of this exact text, with entities) to skip the
+    parse, e.g. from nlp.pipe, and `rules` to skip the rules lookup (e.g.
+    once per dataset instead of once per row).
+    """
+    if rules is None:
+        rules = get_user_rules(user_id)
+    pii_categories = rules.get("pii_categories", {})
+
+    # All matches are found on the original text and replaced together at the end
+    spans: List[Tuple[int, int, str]] = []
+
+    # 1. Apply Blocklist Redaction (one compiled, case-insensitive matcher for all words)
+    matcher = get_blocklist_matcher(rules)
+    if matcher is not None:
+        spans.extend((m.start(1), m.end(1), "[REDACTED]") for m in matcher.finditer(text))
+
+    # 2. Apply SpaCy PII Redaction
+    labels_to_redact = _entity_labels(pii_categories)
     # Note: SpaCy isn't great for emails/phones/credit cards out of the box compared to Presidio, 
     # but using SpaCy as requested. We can add Regex for these if SpaCy misses them.
-    
-    # Iterate entities in reverse order to maintain indices
-    for ent in reversed(doc.ents):
-        if ent.label_ in labels_to_redact:
-            start = ent.start_char
-            end = ent.end_char
-            redacted_text_list[start:end] = "[REDACTED]"
 
-    # Reconstruct text
-    text = "".join(redacted_text_list)
+    if labels_to_redact:
+        if doc is not None and len(doc) and not doc.has_annotation("ENT_IOB"):
+            # A Doc parsed without the entity recognizer would silently leave names and dates in
+            raise ValueError("redact_text_selectively needs a Doc with entity annotation.")
+        if doc is None or doc.text != text:
+            # Shared with Presidio's NLP engine via the model registry
+            nlp = model_registry.get_spacy()
+            # Only entities are read, so the parser, lemmatizer etc. are skipped
+            doc = nlp(text, disable=_ner_only_disabled(nlp))
+        for ent in doc.ents:
+            if ent.label_ in labels_to_redact:
+                spans.append((ent.start_char, ent.end_char, "[REDACTED]"))
 
     # 3. Regex Fallbacks for non-SpaCy entities (Email, Phone, Credit Card)
     if pii_categories.get("emails"):
         email_pattern = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
-        text = re.sub(email_pattern, "[EMAIL_REDACTED]", text)
+        spans.extend((m.start(), m.end(), "[EMAIL_REDACTED]") for m in re.finditer(email_pattern, text))
     
     if pii_categories.get("phone"):
         # Simple phone regex
         phone_pattern = r'\b\d{3}[-.]?\d{3}[-.]?\d{4}\b'
-        text = re.sub(phone_pattern, "[PHONE_REDACTED]", text)
+        spans.extend((m.start(), m.end(), "[PHONE_REDACTED]") for m in re.finditer(phone_pattern, text))
 
     if pii_categories.get("credit_cards"):
         # Simple credit card regex (16 digits)
         cc_pattern = r'\b\d{4}[-\s]?\d{4}[-\s]?\d{4}[-\s]?\d{4}\b'
-        text = re.sub(cc_pattern, "[CC_REDACTED]", text)
+        spans.extend((m.start(), m.end(), "[CC_REDACTED]") for m in re.finditer(cc_pattern, text))
+
+    return _apply_spans(text, spans)
+
+def redact_texts_selectively(texts: Iterable[str], user_id: str, rules: Optional[Dict] = None, batch_size: int = DATASET_NLP_BATCH_SIZE) -> Iterator[str]:
+    """
+    redact_text_selectively over many texts, in order. When the rules need
+    named entities, the texts are parsed in batches with nlp.pipe using only
+    the entity recognizer; the output is the same as one call per text.
+    """
+    if rules is None:
+        rules = get_user_rules(user_id)
+
+    if not _entity_labels(rules.get("pii_categories", {})):
+        for text in texts:
+            yield redact_text_selectively(text, user_id, rules=rules)
+        return
 
-    return text
+    nlp = model_registry.get_spacy()
+    texts, pipe_texts = itertools.tee(texts)
+    docs = nlp.pipe(pipe_texts, batch_size=batch_size, disable=_ner_only_disabled(nlp))
+    for text, doc in zip(texts, docs):
+        yield redact_text_selectively(text, user_id, doc=doc, rules=rules)
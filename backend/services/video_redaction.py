@@ -7,7 +7,9 @@ import shutil
 import time
 import json
 import traceback
+from typing import Optional
 from .audio_redaction import AudioRedactionService
+from . import model_registry, worker_pools
 # Import ultralytics at top level to avoid runtime delays and threading issues
 try:
     from ultralytics import YOLO
@@ -16,7 +18,7 @@ except ImportError:
 
 
 class VideoRedactionService:
-    def __init__(self):
+    def __init__(self, audio_service: Optional[AudioRedactionService] = None):
         self.ffmpeg_path = imageio_ffmpeg.get_ffmpeg_exe()
         print(f"DEBUG: FFmpeg path: {self.ffmpeg_path}", flush=True)
         # Derive ffprobe path
@@ -29,7 +31,8 @@ class VideoRedactionService:
             print(f"DEBUG: ffprobe found at {self.ffprobe_path}", flush=True)
             
         self.face_cascade = None
-        self.audio_service = AudioRedactionService()
+        # Reuse the app's audio service so Whisper and Presidio are not loaded twice
+        self.audio_service = audio_service or AudioRedactionService()
 
     async def process_video(self, file, upload_dir="uploads", output_dir="outputs"):
         os.makedirs(upload_dir, exist_ok=True)
@@ -50,11 +53,20 @@ class VideoRedactionService:
         output_filename = f"redacted_{timestamp}_{filename}"
         output_path = os.path.join(output_dir, output_filename)
 
-        # Save uploaded file
-        with open(input_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
+        # Reserve a worker before writing the upload so busy servers reject fast
+        with worker_pools.video.slot():
+            # Save uploaded file
+            with open(input_path, "wb") as f:
+                content = await file.read()
+                f.write(content)
 
+            # Face detection, Whisper and ffmpeg all block; run them on the video pool
+            return await worker_pools.video.submit(
+                self._redact_video_file, filename, input_path, temp_video_path,
+                temp_audio_path, redacted_audio_path, output_filename, output_path
+            )
+
+    def _redact_video_file(self, filename, input_path, temp_video_path, temp_audio_path, redacted_audio_path, output_filename, output_path):
         try:
             # 1. Process Video (Face Redaction)
             msg = f"DEBUG: Starting Face Redaction on {input_path} -> {temp_video_path}"
@@ -193,7 +205,7 @@ class VideoRedactionService:
         # Load model
         print(f"DEBUG: Loading YOLO model: {model_path}", flush=True)
         try:
-            model = YOLO(model_path)
+            model = model_registry.get_yolo(model_path)
             print("DEBUG: YOLO model loaded successfully object created", flush=True)
         except Exception as e:
             print(f"DEBUG: Failed to load model: {e}", flush=True)
@@ -0,0 +1,87 @@
+import os
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+
+class PoolSaturatedError(Exception):
+    """Raised when a pool's running and queued jobs are already at their limit."""
+
+    def __init__(self, pool_name: str, retry_after: int):
+        super().__init__(f"The {pool_name} workers are busy. Please retry in {retry_after} seconds.")
+        self.pool_name = pool_name
+        self.retry_after = retry_after
+
+
+class BoundedPool:
+    """
+    A sized thread pool with admission control. At most `max_workers` jobs run
+    at once and at most `max_queue` more wait; anything past that is rejected
+    immediately with PoolSaturatedError instead of piling up.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int, retry_after: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-pool")
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def slot(self):
+        """Reserve capacity for one job, e.g. before saving a large upload to disk."""
+        with self._lock:
+            if self._in_flight >= self.max_workers + self.max_queue:
+                raise PoolSaturatedError(self.name, self.retry_after)
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    async def submit(self, fn, *args, **kwargs):
+        """Run fn on the pool. The caller must already hold a slot."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+
+    async def run(self, fn, *args, **kwargs):
+        with self.slot():
+            return await self.submit(fn, *args, **kwargs)
+
+    def status(self) -> dict:
+        with self._lock:
+            in_flight = self._in_flight
+        return {
+            "workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": in_flight,
+        }
+
+
+def _pool_from_env(name: str, workers: int, queue: int, retry_after: int) -> BoundedPool:
+    prefix = name.upper()
+    return BoundedPool(
+        name=name,
+        max_workers=int(os.getenv(f"{prefix}_POOL_WORKERS", str(workers))),
+        max_queue=int(os.getenv(f"{prefix}_POOL_QUEUE", str(queue))),
+        retry_after=int(os.getenv(f"{prefix}_POOL_RETRY_AFTER", str(retry_after))),
+    )
+
+
+# One pool per kind of work so a burst of videos can't starve text uploads.
+# Threads suffice: the models are shared in-process via the model registry, and
+# the heavy native work (spaCy, torch, ffmpeg, argon2) releases the GIL.
+# PyMuPDF is the exception: it isn't thread-safe, so its calls are serialized
+# by pdf_ocr.fitz_lock.
+text = _pool_from_env("text", workers=4, queue=16, retry_after=5)
+audio = _pool_from_env("audio", workers=2, queue=4, retry_after=30)
+video = _pool_from_env("video", workers=1, queue=2, retry_after=60)
+dataset = _pool_from_env("dataset", workers=1, queue=2, retry_after=60)
+hashing = _pool_from_env("hashing", workers=2, queue=32, retry_after=1)
+
+ALL_POOLS = [text, audio, video, dataset, hashing]
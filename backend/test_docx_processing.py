@@ -0,0 +1,175 @@
+import io
+import zipfile
+import docx
+from presidio_analyzer import RecognizerResult
+from docx.opc.constants import RELATIONSHIP_TYPE
+from docx.oxml import parse_xml
+from services.docx_processing import REDACTION_BLOCK, iter_docx_blocks, redact_docx_package, redacted_parts
+
+
+def build_docx() -> bytes:
+    document = docx.Document()
+    document.add_paragraph("Intro paragraph")
+    paragraph = document.add_paragraph("Call ")
+    paragraph.add_run("Jo")
+    paragraph.add_run("hn Smith").add_tab()
+    paragraph.add_run("today").add_break()
+    paragraph.add_run("please")
+    table = document.add_table(rows=1, cols=2)
+    table.cell(0, 0).text = "Cell A"
+    table.cell(0, 1).text = "Cell B"
+    document.add_paragraph("Closing")
+    document.sections[0].header.paragraphs[0].text = "Header text"
+    document.sections[0].footer.paragraphs[0].text = "Footer text"
+    output = io.BytesIO()
+    document.save(output)
+    return output.getvalue()
+
+
+def test_blocks_follow_reading_order():
+    blocks = [(block.part, block.text) for block in iter_docx_blocks(build_docx())]
+    body = [text for part, text in blocks if part == "word/document.xml"]
+    assert body == ["Intro paragraph", "Call John Smith\ttoday\nplease", "Cell A", "Cell B", "Closing"]
+    # Headers and footers come after the body
+    parts = [part for part, text in blocks if text in ("Header text", "Footer text")]
+    assert parts[0].startswith("word/header") and parts[1].startswith("word/footer")
+    assert blocks[0][0] == "word/document.xml" and blocks[-1][0].startswith("word/footer")
+
+
+def test_block_indexes_count_paragraphs_per_part():
+    blocks = [block for block in iter_docx_blocks(build_docx()) if block.part == "word/document.xml"]
+    assert [block.index for block in blocks] == list(range(len(blocks)))
+
+
+def test_tab_stop_definitions_are_not_text():
+    content = build_docx()
+    document = docx.Document(io.BytesIO(content))
+    document.paragraphs[0].paragraph_format.tab_stops.add_tab_stop(docx.shared.Inches(1))
+    output = io.BytesIO()
+    document.save(output)
+    assert next(iter_docx_blocks(output.getvalue())).text == "Intro paragraph"
+
+
+def find_names(*names):
+    # Stand-in analyzer: every occurrence of the given strings
+    def analyze(text):
+        results = []
+        for name in names:
+            start = text.find(name)
+            while start != -1:
+                results.append(RecognizerResult("PERSON", start, start + len(name), 0.85))
+                start = text.find(name, start + 1)
+        return results
+    return analyze
+
+
+def test_redacts_entities_split_across_runs():
+    redacted = redact_docx_package(build_docx(), find_names("John Smith", "Cell B"))
+    texts = [block.text for block in iter_docx_blocks(redacted)]
+    assert f"Call {REDACTION_BLOCK}\ttoday\nplease" in texts
+    assert REDACTION_BLOCK in texts and "Cell A" in texts
+    assert not any("John" in text or "Smith" in text or "Cell B" in text for text in texts)
+
+
+def test_headers_and_footers_are_redacted():
+    redacted = redact_docx_package(build_docx(), find_names("Header", "Footer"))
+    texts = [block.text for block in iter_docx_blocks(redacted)]
+    assert f"{REDACTION_BLOCK} text" in texts and texts.count(f"{REDACTION_BLOCK} text") == 2
+
+
+def test_untouched_parts_are_copied_through():
+    content = build_docx()
+    redacted = redact_docx_package(content, find_names("John Smith"))
+    with zipfile.ZipFile(io.BytesIO(content)) as before, zipfile.ZipFile(io.BytesIO(redacted)) as after:
+        assert before.namelist() == after.namelist()
+        parsed = set(redacted_parts(before.namelist()))
+        for name in before.namelist():
+            if name not in parsed:
+                assert before.read(name) == after.read(name), name
+    # Still a document python-docx can open, with the formatting of the runs kept
+    paragraph = docx.Document(io.BytesIO(redacted)).paragraphs[1]
+    assert [run.text for run in paragraph.runs][:3] == ["Call ", REDACTION_BLOCK, "\t"]
+
+
+def test_no_entities_leaves_text_unchanged():
+    content = build_docx()
+    redacted = redact_docx_package(content, find_names())
+    assert list(iter_docx_blocks(redacted)) == list(iter_docx_blocks(content))
+
+
+W_DECL = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+
+
+def build_docx_with_hidden_text() -> bytes:
+    # The places a name survives outside the visible runs
+    document = docx.Document()
+    paragraph = document.add_paragraph("Reviewed")
+    document.add_comment(paragraph.runs, text="Ask John Smith", author="Jane Roe", initials="JR")
+    document.element.body.append(parse_xml(
+        f'<w:p {W_DECL}><w:del w:id="1" w:author="Jane Roe"><w:r><w:delText>John Smith</w:delText></w:r></w:del></w:p>'
+    ))
+    document.element.body.append(parse_xml(
+        f'<w:p {W_DECL}><w:r><w:fldChar w:fldCharType="begin"/></w:r>'
+        '<w:r><w:instrText xml:space="preserve"> HYPERLINK "mailto:john@example.com" </w:instrText></w:r>'
+        '<w:r><w:fldChar w:fldCharType="separate"/></w:r><w:r><w:t>write</w:t></w:r>'
+        '<w:r><w:fldChar w:fldCharType="end"/></w:r></w:p>'
+    ))
+    document.element.body.append(parse_xml(
+        f'<w:p {W_DECL}><w:fldSimple w:instr=" HYPERLINK &quot;mailto:john@example.com&quot; ">'
+        '<w:r><w:t>mail</w:t></w:r></w:fldSimple></w:p>'
+    ))
+    document.part.relate_to("mailto:john@example.com", RELATIONSHIP_TYPE.HYPERLINK, is_external=True)
+    document.core_properties.author = "Jane Roe"
+    document.core_properties.last_modified_by = "Jane Roe"
+    document.core_properties.title = "Notes on John Smith"
+    output = io.BytesIO()
+    document.save(output)
+    return output.getvalue()
+
+
+def package_text(content: bytes, name: str) -> str:
+    with zipfile.ZipFile(io.BytesIO(content)) as package:
+        return package.read(name).decode("utf-8")
+
+
+def redact_hidden_text() -> bytes:
+    redacted = redact_docx_package(build_docx_with_hidden_text(), find_names("John Smith", "john@example.com"))
+    # Still opens
+    docx.Document(io.BytesIO(redacted))
+    return redacted
+
+
+def test_comments_are_redacted_and_authors_blanked():
+    comments = package_text(redact_hidden_text(), "word/comments.xml")
+    assert f"Ask {REDACTION_BLOCK}" in comments
+    assert "John Smith" not in comments and "Jane Roe" not in comments and 'w:initials="JR"' not in comments
+
+
+def test_tracked_deletions_are_redacted():
+    body = package_text(redact_hidden_text(), "word/document.xml")
+    assert f"<w:delText xml:space=\"preserve\">{REDACTION_BLOCK}</w:delText>" in body
+    assert "John Smith" not in body and "Jane Roe" not in body
+
+
+def test_field_codes_are_redacted():
+    body = package_text(redact_hidden_text(), "word/document.xml")
+    assert "john@example.com" not in body
+    assert f'HYPERLINK "mailto:{REDACTION_BLOCK}"' in body
+    assert f'HYPERLINK &quot;mailto:{REDACTION_BLOCK}&quot;' in body
+
+
+def test_hyperlink_targets_are_replaced():
+    redacted = redact_hidden_text()
+    rels = package_text(redacted, "word/_rels/document.xml.rels")
+    assert "john@example.com" not in rels and 'Target="#"' in rels
+    # Targets without an entity are left alone
+    untouched = redact_docx_package(build_docx_with_hidden_text(), find_names("John Smith"))
+    assert "mailto:john@example.com" in package_text(untouched, "word/_rels/document.xml.rels")
+
+
+def test_document_properties_are_blanked():
+    redacted = redact_hidden_text()
+    assert "Jane Roe" not in package_text(redacted, "docProps/core.xml")
+    properties = docx.Document(io.BytesIO(redacted)).core_properties
+    assert (properties.author, properties.last_modified_by, properties.title) == ("", "", "")
+    assert properties.created is not None
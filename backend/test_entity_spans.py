@@ -0,0 +1,78 @@
+import random
+from presidio_analyzer import RecognizerResult
+from presidio_anonymizer import AnonymizerEngine
+from services.entity_spans import BLOCK, REPLACEMENT_STYLES, encode_spans, redaction_ranges, render_ranges, resolve_results
+
+anonymizer = AnonymizerEngine()
+
+
+def anonymize(text, results):
+    # What RedactionService.anonymize does for the "block" style
+    return anonymizer.anonymize(
+        text=text, analyzer_results=resolve_results(text, results), operators=REPLACEMENT_STYLES["block"]
+    ).text
+
+
+def assert_ranges_reproduce(text, results):
+    ranges = redaction_ranges(text, encode_spans(results))
+    assert render_ranges(text, ranges, BLOCK) == anonymize(text, results)
+    for (_, end, _), (start, _, _) in zip(ranges, ranges[1:]):
+        assert end <= start
+
+
+def test_same_type_separated_by_spaces_is_one_range():
+    text = "Bond  James Bond"
+    results = [RecognizerResult("PERSON", 0, 4, 0.8), RecognizerResult("PERSON", 6, 16, 0.8)]
+    assert redaction_ranges(text, encode_spans(results)) == [[0, 16, "PERSON"]]
+    assert_ranges_reproduce(text, results)
+
+
+def test_different_types_separated_by_spaces_stay_apart():
+    text = "Paris 555-123-4567"
+    results = [RecognizerResult("LOCATION", 0, 5, 0.8), RecognizerResult("PHONE_NUMBER", 6, 18, 0.9)]
+    assert redaction_ranges(text, encode_spans(results)) == [[0, 5, "LOCATION"], [6, 18, "PHONE_NUMBER"]]
+    assert_ranges_reproduce(text, results)
+
+
+def test_overlaps_merge_under_the_first_type():
+    text = "Contact jane.doe@example.com today"
+    results = [
+        RecognizerResult("EMAIL_ADDRESS", 8, 28, 1.0),
+        RecognizerResult("URL", 17, 28, 0.5),
+        RecognizerResult("PERSON", 8, 16, 0.85),
+    ]
+    assert redaction_ranges(text, encode_spans(results)) == [[8, 28, "EMAIL_ADDRESS"]]
+    assert_ranges_reproduce(text, results)
+
+
+def test_partial_overlap_of_different_types():
+    text = "abcdefghijklmnopqrst"
+    results = [RecognizerResult("PERSON", 2, 10, 0.6), RecognizerResult("LOCATION", 6, 14, 0.9)]
+    assert redaction_ranges(text, encode_spans(results)) == [[2, 14, "PERSON"]]
+    assert_ranges_reproduce(text, results)
+
+
+def test_entity_and_score_filters():
+    text = "Jane lives in Paris"
+    spans = [["PERSON", 0, 4, 0.85], ["LOCATION", 14, 19, 0.4]]
+    assert redaction_ranges(text, spans, entities=["LOCATION"]) == [[14, 19, "LOCATION"]]
+    assert redaction_ranges(text, spans, score_threshold=0.5) == [[0, 4, "PERSON"]]
+
+
+def test_resolve_does_not_modify_its_input():
+    results = [RecognizerResult("PERSON", 0, 4, 0.8), RecognizerResult("PERSON", 2, 8, 0.9)]
+    resolve_results("Jane Doe", results)
+    assert [(r.start, r.end, r.score) for r in results] == [(0, 4, 0.8), (2, 8, 0.9)]
+
+
+def test_random_spans_render_to_the_anonymizer_output():
+    rng = random.Random(0)
+    types = ["PERSON", "LOCATION", "EMAIL_ADDRESS"]
+    for _ in range(300):
+        text = "".join(rng.choice("ab  ") for _ in range(40))
+        results = []
+        for _ in range(rng.randint(0, 6)):
+            start = rng.randrange(0, 39)
+            end = rng.randint(start + 1, min(40, start + 10))
+            results.append(RecognizerResult(rng.choice(types), start, end, round(rng.random(), 2)))
+        assert_ranges_reproduce(text, results)
@@ -0,0 +1,67 @@
+import random
+from services.parallel_analysis import merge_results, split_text
+
+
+def assert_covers(text, chunks):
+    # Chunks sit at their offsets, start at 0, reach the end and never leave a gap
+    assert chunks[0][0] == 0
+    covered = 0
+    for offset, chunk in chunks:
+        assert chunk and text[offset:offset + len(chunk)] == chunk
+        assert offset <= covered
+        covered = max(covered, offset + len(chunk))
+    assert covered == len(text)
+
+
+def test_short_text_is_one_chunk():
+    assert split_text("short text", chunk_size=100, overlap=10) == [(0, "short text")]
+    assert split_text("", chunk_size=100, overlap=10) == []
+
+
+def test_cuts_on_paragraph_boundaries():
+    text = "a" * 60 + "\n\n" + "b" * 60
+    chunks = split_text(text, chunk_size=100, overlap=0)
+    assert chunks[0] == (0, "a" * 60 + "\n\n")
+    assert_covers(text, chunks)
+
+
+def test_consecutive_chunks_overlap_without_splitting_words():
+    text = " ".join(f"word{i}" for i in range(200))
+    chunks = split_text(text, chunk_size=100, overlap=30)
+    assert_covers(text, chunks)
+    for (offset, chunk), (next_offset, _) in zip(chunks, chunks[1:]):
+        assert next_offset < offset + len(chunk)
+        assert text[next_offset - 1] == " "
+
+
+def test_text_without_boundaries_still_advances():
+    text = "x" * 250
+    chunks = split_text(text, chunk_size=100, overlap=120)
+    assert_covers(text, chunks)
+    assert [offset for offset, _ in chunks] == sorted({offset for offset, _ in chunks})
+
+
+def test_random_texts_are_covered():
+    rng = random.Random(3)
+    for _ in range(200):
+        text = "".join(rng.choice("ab .\n") for _ in range(rng.randint(1, 400)))
+        assert_covers(text, split_text(text, chunk_size=rng.randint(10, 80), overlap=rng.randint(0, 20)))
+
+
+def test_merge_keeps_best_score_of_duplicates():
+    merged = merge_results([("PERSON", 10, 20, 0.6), ("PERSON", 10, 20, 0.85)])
+    assert [(r.entity_type, r.start, r.end, r.score) for r in merged] == [("PERSON", 10, 20, 0.85)]
+
+
+def test_merge_drops_spans_cut_short_by_a_chunk_edge():
+    # The first chunk ended mid-name, the next one saw it whole
+    merged = merge_results([("PERSON", 95, 100, 0.85), ("PERSON", 95, 104, 0.85), ("PERSON", 97, 104, 0.85)])
+    assert [(r.start, r.end) for r in merged] == [(95, 104)]
+
+
+def test_merge_keeps_other_entity_types_at_the_same_place():
+    merged = merge_results([("LOCATION", 0, 6, 0.85), ("PERSON", 0, 6, 0.85), ("PERSON", 8, 12, 0.5)])
+    assert sorted((r.entity_type, r.start, r.end) for r in merged) == [
+        ("LOCATION", 0, 6), ("PERSON", 0, 6), ("PERSON", 8, 12)
+    ]
+    assert [r.start for r in merged] == sorted(r.start for r in merged)
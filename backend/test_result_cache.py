@@ -0,0 +1,61 @@
+import os
+from services.result_cache import ResultCache, make_key
+
+
+def test_key_depends_on_content_and_every_part():
+    key = make_key(b"file", "presidio", "PERSON")
+    assert key == make_key(b"file", "presidio", "PERSON")
+    assert key != make_key(b"other", "presidio", "PERSON")
+    assert key != make_key(b"file", "presidio", "LOCATION")
+    # Parts are delimited, so moving text between them changes the key
+    assert make_key(b"file", "ab", "c") != make_key(b"file", "a", "bc")
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = ResultCache(max_entries=2)
+    cache.put("a", {"v": 1})
+    cache.put("b", {"v": 2})
+    assert cache.get("a") == {"v": 1}
+    cache.put("c", {"v": 3})
+    assert cache.get("b") is None
+    assert cache.get("a") == {"v": 1} and cache.get("c") == {"v": 3}
+
+
+def test_disk_tier_survives_a_new_cache(tmp_path):
+    cache = ResultCache(max_entries=4, disk_dir=str(tmp_path))
+    cache.put("ab12", {"status": "success", "spans": [[0, 4, "PERSON"]]})
+    cache.put("cd34", b"%PDF-bytes")
+
+    reopened = ResultCache(max_entries=4, disk_dir=str(tmp_path))
+    assert reopened.get("ab12") == {"status": "success", "spans": [[0, 4, "PERSON"]]}
+    assert reopened.get("cd34") == b"%PDF-bytes"
+    assert reopened.get("ef56") is None
+    assert os.path.exists(tmp_path / "ab" / "ab12.json")
+    assert os.path.exists(tmp_path / "cd" / "cd34.bin")
+    assert not [name for _, _, names in os.walk(tmp_path) for name in names if name.endswith(".tmp")]
+
+
+def test_disk_hit_is_promoted_to_memory(tmp_path):
+    cache = ResultCache(max_entries=4, disk_dir=str(tmp_path))
+    cache.put("ab12", {"v": 1})
+    reopened = ResultCache(max_entries=4, disk_dir=str(tmp_path))
+    reopened.get("ab12")
+    os.remove(tmp_path / "ab" / "ab12.json")
+    assert reopened.get("ab12") == {"v": 1}
+
+
+def test_zero_entries_disables_memory_tier(tmp_path):
+    cache = ResultCache(max_entries=0)
+    cache.put("a", {"v": 1})
+    assert cache.get("a") is None
+
+    cache = ResultCache(max_entries=0, disk_dir=str(tmp_path))
+    cache.put("ab12", {"v": 1})
+    assert cache.get("ab12") == {"v": 1}
+
+
+def test_corrupt_disk_entry_is_a_miss(tmp_path):
+    cache = ResultCache(max_entries=0, disk_dir=str(tmp_path))
+    os.makedirs(tmp_path / "ab")
+    (tmp_path / "ab" / "ab12.json").write_text("{not json", encoding="utf-8")
+    assert cache.get("ab12") is None
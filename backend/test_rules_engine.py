@@ -0,0 +1,76 @@
+import random
+import re
+from services.rules_engine import _apply_spans, compile_blocklist
+
+
+def blocklist_spans(blocklist, text):
+    # How redact_text_selectively turns matcher hits into spans
+    matcher = compile_blocklist(blocklist)
+    if matcher is None:
+        return []
+    return [(m.start(1), m.end(1), "[REDACTED]") for m in matcher.finditer(text)]
+
+
+def per_word_spans(blocklist, text):
+    # One search per word, each reporting overlapping occurrences too
+    spans = []
+    for word in blocklist:
+        if word:
+            pattern = "(?=(" + re.escape(word) + "))"
+            spans.extend((m.start(1), m.end(1), "[REDACTED]") for m in re.finditer(pattern, text, re.IGNORECASE))
+    return spans
+
+
+def test_empty_blocklist_has_no_matcher():
+    assert compile_blocklist([]) is None
+    assert compile_blocklist([""]) is None
+
+
+def test_matching_ignores_case():
+    assert blocklist_spans(["Acme"], "ACME and acme") == [(0, 4, "[REDACTED]"), (9, 13, "[REDACTED]")]
+
+
+def test_longer_word_wins_over_its_prefix():
+    assert blocklist_spans(["pro", "project"], "project pro") == [(0, 7, "[REDACTED]"), (8, 11, "[REDACTED]")]
+
+
+def test_overlapping_repeats_are_all_found():
+    assert [span[:2] for span in blocklist_spans(["aa"], "aaaa")] == [(0, 2), (1, 3), (2, 4)]
+    assert _apply_spans("aaaa", blocklist_spans(["aa"], "aaaa")) == "[REDACTED]"
+
+
+def test_special_characters_are_literal():
+    assert _apply_spans("a.b axb (c)", blocklist_spans(["a.b", "(c)"], "a.b axb (c)")) == "[REDACTED] axb [REDACTED]"
+
+
+def test_apply_spans_merges_overlaps_keeping_first_listed():
+    spans = [(4, 9, "[B]"), (0, 6, "[A]"), (4, 6, "[C]")]
+    assert _apply_spans("0123456789", spans) == "[A]9"
+    assert _apply_spans("0123456789", [(4, 6, "[C]"), (4, 9, "[B]")]) == "0123[C]9"
+
+
+def test_apply_spans_keeps_adjacent_spans_apart():
+    assert _apply_spans("abcdef", [(2, 4, "[Y]"), (0, 2, "[X]")]) == "[X][Y]ef"
+    assert _apply_spans("abc", []) == "abc"
+
+
+def test_same_redaction_as_one_search_per_word():
+    rng = random.Random(7)
+    for _ in range(300):
+        blocklist = ["".join(rng.choice("abAB.") for _ in range(rng.randint(1, 4))) for _ in range(rng.randint(1, 5))]
+        text = "".join(rng.choice("abAB. ") for _ in range(rng.randint(0, 40)))
+        expected = _apply_spans(text, per_word_spans(blocklist, text))
+        assert _apply_spans(text, blocklist_spans(blocklist, text)) == expected, (blocklist, text)
+
+
+def test_long_term_compiles():
+    term = "x" * 5000
+    assert blocklist_spans([term, "xy"], "a " + term + " b") == [(2, 5002, "[REDACTED]")]
+
+
+def test_deeply_nested_prefixes_compile():
+    # Each word a prefix of the next: too deep for the prefix-tree pattern
+    blocklist = ["a" * length for length in range(1, 601)]
+    text = "b" + "a" * 700
+    assert blocklist_spans(blocklist, text)[0] == (1, 601, "[REDACTED]")
+    assert _apply_spans(text, blocklist_spans(blocklist, text)) == _apply_spans(text, per_word_spans(blocklist, text))
@@ -138,8 +138,8 @@ export default function LLMCleanerPage() {
                                         setError(null);
                                     }}
                                     isProcessing={isUploading}
-                                    accept=".csv,.jsonl"
-                                    supportText="Supports CSV, JSONL (Massive files supported)"
+                                    accept=".csv,.jsonl,.parquet"
+                                    supportText="Supports CSV, JSONL, Parquet (Massive files supported)"
                                 />
 
                                 {file && (
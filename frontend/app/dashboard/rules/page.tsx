@@ -88,6 +88,14 @@ export default function RedactionRulesPage() {
                 .upsert(rulesToSave, { onConflict: 'user_id' });
 
             if (error) throw error;
+
+            // Drop the API's cached copy so the next redaction uses the new rules
+            const formData = new FormData();
+            formData.append("user_id", user.id);
+            await fetch(`${process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000'}/rules/invalidate`, {
+                method: "POST",
+                body: formData,
+            });
         } catch (error) {
             console.error('Error saving rules:', error);
         } finally {
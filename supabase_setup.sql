@@ -22,3 +22,23 @@ create policy "Users can insert their own rules" on public.redaction_rules
 
 create policy "Users can update their own rules" on public.redaction_rules
   for update using (auth.uid() = user_id);
+
+-- Entity spans of each processed document, used to re-redact it without NLP
+alter table public.documents add column if not exists entity_spans jsonb;
+
+-- Entity index: one row per distinct (document, entity type, value); values are stored as hashes
+create table if not exists public.entity_index (
+  document_id bigint references public.documents (id) on delete cascade,
+  user_id text,
+  entity_type text not null,
+  value_hash text not null
+);
+
+create index if not exists entity_index_lookup
+  on public.entity_index (user_id, entity_type, value_hash, document_id);
+-- Searches by entity type alone, newest documents first
+create index if not exists entity_index_by_type
+  on public.entity_index (user_id, entity_type, document_id);
+
+-- Only the backend (service role) reads and writes the index
+alter table public.entity_index enable row level security;